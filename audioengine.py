@@ -0,0 +1,367 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# In-process degradation engine. Signals are mono float32 NumPy arrays in the
+# [-1, 1) range, i.e. the same scale sox reports in 'stat', so levels and
+# SNRs computed here match the ones of the sox backend.
+
+import io
+import os
+import re
+import subprocess
+import weakref
+from math import gcd
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import firwin, lfilter, resample_poly
+
+from filterbank import filterBank
+from sphere import readSphere, splitChannel
+
+soxBin = ['sox', '-V1']
+sph2pipeBin = ['sph2pipe']
+
+int16Max = 32767 / 32768
+
+
+def loadAudio(fileName, rate=None):
+    fext = os.path.splitext(fileName)[1]
+    if fext == '.sph':
+        try:
+            x, fs = readSphere(fileName)
+            x = x[:, None]
+        except NotImplementedError:
+            path, channel = splitChannel(fileName)
+            wav = subprocess.check_output(sph2pipeBin + ['-p', '-f', 'rif', '-c', str(channel + 1), path])
+            x, fs = sf.read(io.BytesIO(wav), dtype='float32', always_2d=True)
+    else:
+        try:
+            x, fs = sf.read(fileName, dtype='float32', always_2d=True)
+        except (RuntimeError, sf.LibsndfileError):
+            # formats libsndfile cannot read are decoded by sox into a pipe
+            wav = subprocess.check_output(soxBin + [fileName, '-t', 'wav', '-b', '16', '-'])
+            x, fs = sf.read(io.BytesIO(wav), dtype='float32', always_2d=True)
+    x = x.mean(axis=1, dtype=np.float32) if x.shape[1] > 1 else x[:, 0]
+    if rate is not None and rate != fs:
+        x = resample(x, fs, rate)
+        fs = rate
+    return x, fs
+
+
+def loadSegment(fileName, start, stop, rate):
+    # samples [start, stop) counted at 'rate', seeking instead of decoding
+    # everything before 'start'
+    try:
+        fs = sf.info(fileName).samplerate
+    except (RuntimeError, sf.LibsndfileError):
+        x, _ = loadAudio(fileName, rate)
+        return x[start:stop]
+    x, _ = sf.read(fileName, start=start * fs // rate, stop=-(-stop * fs // rate), dtype='float32', always_2d=True)
+    x = x.mean(axis=1, dtype=np.float32) if x.shape[1] > 1 else x[:, 0]
+    return resample(x, fs, rate)[:stop - start]
+
+
+def saveAudio(fileName, x, rate):
+    fmt = os.path.splitext(fileName)[1][1:].upper()
+    subtype = 'PCM_16' if sf.check_format(fmt, 'PCM_16') else None
+    sf.write(fileName, np.clip(x, -1.0, int16Max), rate, subtype=subtype)
+
+
+def clip(x):
+    return np.clip(x, -1.0, int16Max, out=x)
+
+
+# low-pass kernels of the polyphase resamplers, per (up, down) factors
+resampleKernels = {}
+
+
+def resampleFactors(rateIn, rateOut):
+    g = gcd(int(rateIn), int(rateOut))
+    return int(rateOut) // g, int(rateIn) // g
+
+
+def resampleKernel(up, down):
+    # the Kaiser FIR resample_poly designs by default, designed once per
+    # rate pair (e.g. 10 * 441 taps on each side for 44.1k -> 16k)
+    if (up, down) not in resampleKernels:
+        maxRate = max(up, down)
+        resampleKernels[(up, down)] = firwin(20 * maxRate + 1, 1.0 / maxRate, window=('kaiser', 5.0))
+    return resampleKernels[(up, down)]
+
+
+def resample(x, rateIn, rateOut):
+    if rateIn == rateOut:
+        return x
+    up, down = resampleFactors(rateIn, rateOut)
+    # the kernel in the dtype of x, as resample_poly uses by default
+    h = resampleKernel(up, down).astype(x.dtype)
+    return resample_poly(x, up, down, window=h).astype(np.float32, copy=False)
+
+
+def rms(x):
+    if len(x) == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(np.square(x, dtype=np.float64))))
+
+
+def getAudioStats(x, rate):
+    return len(x), len(x) / rate, rms(x)
+
+
+class SpeechLevelMeter:
+    # active speech level following ITU-T P.56 method B: the envelope is
+    # smoothed with two 30 ms one-pole filters, activity against 15 thresholds
+    # 2^j (16-bit scale) is counted with a 200 ms hangover, and the level is
+    # interpolated where the level above a threshold falls to the 15.9 dB
+    # margin. Blocks are fed one at a time, the state has a fixed size.
+    nThresholds = 15
+    margin = 15.9
+
+    def __init__(self, rate, timeConstant=0.03, hangover=0.2):
+        self.g = np.exp(-1 / (rate * timeConstant))
+        self.hang = int(round(hangover * rate))
+        self.c = 2.0**np.arange(self.nThresholds) / 32768
+        self.zq = np.zeros(1)
+        self.zp = np.zeros(1)
+        # index of the last sample above each threshold
+        self.last = np.full(self.nThresholds, -self.hang - 1, dtype=np.int64)
+        self.a = np.zeros(self.nThresholds, dtype=np.int64)
+        self.sq = 0.0
+        self.nSamples = 0
+
+    def process(self, x):
+        if len(x) == 0:
+            return
+        b, a = [1 - self.g], [1, -self.g]
+        q, self.zq = lfilter(b, a, np.abs(x, dtype=np.float64), zi=self.zq)
+        p, self.zp = lfilter(b, a, q, zi=self.zp)
+        n = self.nSamples + np.arange(len(x))
+        for j in range(self.nThresholds):
+            above = np.where(p >= self.c[j], n, -self.hang - 1)
+            last = np.maximum(np.maximum.accumulate(above), self.last[j])
+            self.a[j] += np.count_nonzero(n - last <= self.hang)
+            self.last[j] = last[-1]
+        self.sq += float(np.sum(np.square(x, dtype=np.float64)))
+        self.nSamples += len(x)
+
+    def result(self):
+        if self.nSamples == 0 or self.sq == 0:
+            return 0.0
+        A = np.full(self.nThresholds, np.inf)
+        nz = self.a > 0
+        A[nz] = 10 * np.log10(self.sq / self.a[nz])
+        C = 20 * np.log10(self.c)
+        d = A - C
+        below = np.flatnonzero(d <= self.margin)
+        if len(below) == 0 or below[0] == 0 or not np.isfinite(d[below[0] - 1]):
+            # no speech activity detected, fall back to the long-term level
+            return float(np.sqrt(self.sq / self.nSamples))
+        j = below[0]
+        t = (d[j - 1] - self.margin) / (d[j - 1] - d[j])
+        return float(10**((A[j - 1] + t * (A[j] - A[j - 1])) / 20))
+
+
+# active speech levels of engine buffers, so that e.g. the 'noise' step after
+# 'norm' does not measure a level that is already known
+speechLevels = {}
+
+
+def rememberSpeechRMSAmp(x, level):
+    key = id(x)
+    speechLevels[key] = (weakref.ref(x, lambda r: speechLevels.pop(key, None)), level)
+
+
+def getSpeechRMSAmp(x, rate):
+    entry = speechLevels.get(id(x))
+    if entry is not None and entry[0]() is x:
+        return entry[1]
+    meter = SpeechLevelMeter(rate)
+    meter.process(x)
+    level = meter.result()
+    rememberSpeechRMSAmp(x, level)
+    return level
+
+
+def applyGain(x, gain):
+    return clip(x * np.float32(gain))
+
+
+def applyNorm(x, rate, level):
+    gain = 10**(level / 20) / getSpeechRMSAmp(x, rate)
+    y = x * np.float32(gain)
+    clipped = np.any(y >= int16Max) or np.any(y <= -1.0)
+    y = clip(y)
+    if not clipped:
+        rememberSpeechRMSAmp(y, 10**(level / 20))
+    return y
+
+
+def applyFilter(x, rate, name, cutoff=None):
+    # a filter of the filter bank (bp, g712, p341, irs, mirs): linear-phase
+    # FIR, delay compensated like 'sox sinc'
+    H, nfft, numtaps = filterBank.getSpectrum(name, rate, cutoff)
+    d = numtaps // 2
+    y = convolveIR(np.concatenate([x, np.zeros(d, dtype=np.float32)]), H, nfft, numtaps)[d:]
+    return clip(y)
+
+
+def applyBandpass(x, rate, freqLo, freqHi):
+    return applyFilter(x, rate, 'bp', (freqLo, freqHi))
+
+
+def mixNoise(x, noise, scaling):
+    # 'noise' may also be a raw int16 slice of a noise pack
+    if noise.dtype == np.int16:
+        scaling = scaling / 32768
+    n = min(len(x), len(noise))
+    y = x.copy()
+    y[:n] += np.float32(scaling) * noise[:n]
+    return clip(y)
+
+
+class NoiseLoop:
+    # reads 'noise' (float32, or int16 from a noise pack) from 'start' on,
+    # block by block. At the end the noise starts again from the beginning:
+    # its last fadeSec seconds are crossfaded (equal power) with its first
+    # ones, so a noise shorter than the speech covers all of it.
+    def __init__(self, noise, start=0, rate=16000, fadeSec=0.05):
+        self.noise = noise
+        self.scale = np.float32(1 / 32768 if noise.dtype == np.int16 else 1)
+        self.L = len(noise)
+        self.fade = min(int(fadeSec * rate), self.L // 2)
+        self.pos = min(start, self.L)
+        t = (np.arange(self.fade) + 0.5) / max(self.fade, 1) * np.pi / 2
+        self.fadeIn = np.sin(t).astype(np.float32)
+        self.fadeOut = np.cos(t).astype(np.float32)
+
+    def read(self, n, out=None):
+        if out is None:
+            out = np.empty(n, dtype=np.float32)
+        if self.L == 0:
+            out[:] = 0
+            return out
+        i, end = 0, self.L - self.fade
+        while i < n:
+            if self.pos < end:
+                k = min(n - i, end - self.pos)
+                np.multiply(self.noise[self.pos:self.pos + k], self.scale, out=out[i:i + k], casting='unsafe')
+            elif self.fade:
+                j = self.pos - end
+                k = min(n - i, self.fade - j)
+                out[i:i + k] = (self.noise[self.pos:self.pos + k] * self.fadeOut[j:j + k] +
+                                self.noise[j:j + k] * self.fadeIn[j:j + k]) * self.scale
+            else:
+                self.pos = 0
+                continue
+            self.pos += k
+            i += k
+            if self.pos == self.L:
+                self.pos = self.fade
+        return out
+
+
+def mixNoiseSNR(x, noise, speechRMSAmp, snr):
+    # adds 'noise' (a NoiseLoop) scaled to 'snr' dB below the speech level,
+    # measured against the noise actually added. Returns the mixture and the
+    # SNR achieved after clipping.
+    y = noise.read(len(x))
+    noiseRMSAmp = rms(y)
+    gain = speechRMSAmp / noiseRMSAmp / 10**(snr / 20) if noiseRMSAmp > 0 else 0.0
+    y *= np.float32(gain)
+    y += x
+    clip(y)
+    d = np.subtract(y, x)
+    addedRMSAmp = rms(d)
+    achieved = 20 * np.log10(speechRMSAmp / addedRMSAmp) if addedRMSAmp > 0 and speechRMSAmp > 0 else float('inf')
+    return y, achieved
+
+
+def nextPow2(n):
+    return 1 << (int(n) - 1).bit_length()
+
+
+class IRStore:
+    # impulse responses and their spectra, computed once per IR and rate and
+    # reused by every convolution with it. IRs are looked up in the packed IR
+    # banks written by prepare-impulse-responses.py, names that are paths to
+    # old text '-16000.ir' files are still read from disk.
+    def __init__(self, bankPrefix='impulse-responses/ir-bank'):
+        self.bankPrefix = bankPrefix
+        self.banks = {}
+        self.spectra = {}
+
+    def getBank(self, rate):
+        if rate not in self.banks:
+            from irbank import IRBank
+            self.banks[rate] = IRBank.open(self.bankPrefix, rate)
+        return self.banks[rate]
+
+    def getIR(self, name, rate):
+        bank = self.getBank(rate)
+        if bank is not None and name in bank:
+            return bank.get(name)
+        return np.loadtxt(re.sub(r'-16000\.ir$', f'-{rate}.ir', name), dtype=np.float32, ndmin=1)
+
+    def getSpectrum(self, name, rate):
+        if (name, rate) not in self.spectra:
+            h = self.getIR(name, rate)
+            # blocks at least as long as the IR, so a block tail only overlaps
+            # the next block
+            nfft = max(4096, nextPow2(2 * len(h)))
+            self.spectra[(name, rate)] = (np.fft.rfft(h, nfft), nfft, len(h))
+        return self.spectra[(name, rate)]
+
+
+def convolveBlocks(x, H, nfft, irLen, tail):
+    # FFT overlap-add of x, whose length is a multiple of the block length
+    # nfft - irLen + 1; 'tail' carries the overlap from the previous call
+    B = nfft - irLen + 1
+    yb = np.fft.irfft(np.fft.rfft(x.reshape(-1, B), nfft, axis=1) * H, nfft, axis=1)
+    out = yb[:, :B].copy()
+    out[1:, :irLen - 1] += yb[:-1, B:]
+    out[0, :irLen - 1] += tail
+    return out.ravel().astype(np.float32), yb[-1, B:]
+
+
+def convolveIR(x, H, nfft, irLen, blocksPerChunk=64):
+    # a chunk of blocks at a time to bound memory; the output keeps the
+    # length of the input
+    B = nfft - irLen + 1
+    y = np.empty(len(x), dtype=np.float32)
+    tail = np.zeros(irLen - 1)
+    for start in range(0, len(x), B * blocksPerChunk):
+        chunk = x[start:start + B * blocksPerChunk]
+        xb = np.zeros(-(-len(chunk) // B) * B, dtype=np.float32)
+        xb[:len(chunk)] = chunk
+        out, tail = convolveBlocks(xb, H, nfft, irLen, tail)
+        y[start:start + len(chunk)] = out[:len(chunk)]
+    return y
+
+
+def wetSpectrum(H, wet):
+    # convolving with wet * h + (1 - wet) * delta mixes in the dry signal
+    return H if wet >= 100 else (wet / 100) * H + (1 - wet / 100)
+
+
+def applyIR(x, rate, irStore, name, wet=100):
+    H, nfft, irLen = irStore.getSpectrum(name, rate)
+    return clip(convolveIR(x, wetSpectrum(H, wet), nfft, irLen))
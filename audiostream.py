@@ -0,0 +1,314 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Block-wise versions of the audioengine operations. Every stage keeps the
+# state it needs between blocks; process() takes a block of any length and
+# returns the output available so far, flush() returns what is left at the
+# end of the signal. Memory use does not depend on the signal length.
+
+import os
+import struct
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+import audioengine
+import codecbackend
+from sphere import SphereReader, splitChannel
+
+blockSize = 65536
+
+empty = np.zeros(0, dtype=np.float32)
+
+
+def toMono(x):
+    return x.mean(axis=1, dtype=np.float32) if x.shape[1] > 1 else x[:, 0]
+
+
+def readSphereBlocks(fileName, blockSize):
+    try:
+        reader = SphereReader(fileName)
+        return reader.rate, reader.blocks(blockSize)
+    except NotImplementedError:
+        pass
+    # sph2pipe writes a canonical 44 byte RIFF header followed by the samples
+    path, channel = splitChannel(fileName)
+    proc = subprocess.Popen(audioengine.sph2pipeBin + ['-p', '-f', 'rif', '-c', str(channel + 1), path], stdout=subprocess.PIPE)
+    header = proc.stdout.read(44)
+    rate = struct.unpack('<I', header[24:28])[0]
+
+    def blocks():
+        try:
+            while True:
+                data = proc.stdout.read(2 * blockSize)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2').astype(np.float32) / 32768
+        finally:
+            proc.stdout.close()
+            if proc.wait() != 0:
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    return rate, blocks()
+
+
+def readBlocks(fileName, blockSize=blockSize):
+    if os.path.splitext(fileName)[1] == '.sph':
+        return readSphereBlocks(fileName, blockSize)
+    f = sf.SoundFile(fileName)
+
+    def blocks():
+        with f:
+            for x in f.blocks(blocksize=blockSize, dtype='float32', always_2d=True):
+                yield toMono(x)
+    return f.samplerate, blocks()
+
+
+def runStages(blocks, stages):
+    for x in blocks:
+        for st in stages:
+            x = st.process(x)
+        if len(x):
+            yield x
+    for i, st in enumerate(stages):
+        x = st.flush()
+        for st2 in stages[i + 1:]:
+            x = st2.process(x)
+        if len(x):
+            yield x
+
+
+class Stage:
+    def process(self, x):
+        return x
+
+    def flush(self):
+        return empty
+
+
+class GainStage(Stage):
+    def __init__(self, gain):
+        self.gain = gain
+
+    def process(self, x):
+        return audioengine.applyGain(x, self.gain)
+
+
+class ConvolverStage(Stage):
+    # overlap-add FIR filtering; the first 'delay' output samples are dropped
+    # and the output has as many samples as the input
+    def __init__(self, H, nfft, irLen, delay=0):
+        self.H, self.nfft, self.irLen = H, nfft, irLen
+        self.B = nfft - irLen + 1
+        self.tail = np.zeros(irLen - 1)
+        self.pending = empty
+        self.skip = delay
+        self.nIn = 0
+        self.nOut = 0
+
+    def emit(self, y):
+        if self.skip:
+            d = min(self.skip, len(y))
+            y = y[d:]
+            self.skip -= d
+        y = y[:self.nIn - self.nOut]
+        self.nOut += len(y)
+        return audioengine.clip(y)
+
+    def process(self, x):
+        self.nIn += len(x)
+        x = np.concatenate([self.pending, x]) if len(self.pending) else x
+        nFull = len(x) // self.B * self.B
+        self.pending = x[nFull:]
+        if nFull == 0:
+            return empty
+        y, self.tail = audioengine.convolveBlocks(x[:nFull], self.H, self.nfft, self.irLen, self.tail)
+        return self.emit(y)
+
+    def flush(self):
+        x = np.zeros(self.B, dtype=np.float32)
+        x[:len(self.pending)] = self.pending
+        y, self.tail = audioengine.convolveBlocks(x, self.H, self.nfft, self.irLen, self.tail)
+        y = self.emit(np.concatenate([y, self.tail.astype(np.float32)]))
+        missing = self.nIn - self.nOut
+        self.nOut += missing
+        return np.concatenate([y, np.zeros(missing, dtype=np.float32)]) if missing else y
+
+
+# polyphase banks of ResamplerStage, per (up, down) factors
+polyphaseBanks = {}
+
+
+def polyphaseBank(up, down):
+    # taps of phase p are h[p], h[p + up], h[p + 2 up], ... of the kernel of
+    # audioengine.resample
+    if (up, down) not in polyphaseBanks:
+        h = audioengine.resampleKernel(up, down) * up
+        T = -(-len(h) // up)
+        hp = np.zeros(T * up)
+        hp[:len(h)] = h
+        polyphaseBanks[(up, down)] = hp.reshape(T, up).T.copy()
+    return polyphaseBanks[(up, down)]
+
+
+class ResamplerStage(Stage):
+    # polyphase resampler giving the same output as scipy's resample_poly
+    # (same Kaiser FIR design and alignment), computed block by block
+    def __init__(self, rateIn, rateOut):
+        self.up, self.down = audioengine.resampleFactors(rateIn, rateOut)
+        if self.up == self.down:
+            return
+        self.halfLen = 10 * max(self.up, self.down)
+        self.bank = polyphaseBank(self.up, self.down)
+        self.T = self.bank.shape[1]
+        self.buf = empty
+        self.bufStart = 0
+        self.nIn = 0
+        self.m = 0
+
+    def compute(self, m1):
+        m = np.arange(self.m, m1)
+        p = m * self.down + self.halfLen
+        phase = p % self.up
+        base = (p - phase) // self.up
+        idx = base[:, None] - np.arange(self.T)[None, :] - self.bufStart
+        valid = (idx >= 0) & (idx < len(self.buf))
+        x = np.where(valid, self.buf[np.clip(idx, 0, max(0, len(self.buf) - 1))] if len(self.buf) else 0.0, 0.0)
+        y = np.einsum('ij,ij->i', self.bank[phase], x).astype(np.float32)
+        self.m = m1
+        keep = max(0, (m1 * self.down + self.halfLen) // self.up - self.T + 1 - self.bufStart)
+        self.buf = self.buf[keep:]
+        self.bufStart += keep
+        return y
+
+    def process(self, x):
+        if self.up == self.down:
+            return x
+        self.nIn += len(x)
+        self.buf = np.concatenate([self.buf, x]) if len(self.buf) else x
+        # outputs whose newest input sample is already available
+        m1 = max(self.m, ((self.nIn - 1) * self.up - self.halfLen) // self.down + 1)
+        return self.compute(m1) if m1 > self.m else empty
+
+    def flush(self):
+        if self.up == self.down:
+            return empty
+        m1 = -(-self.nIn * self.up // self.down)
+        return self.compute(m1) if m1 > self.m else empty
+
+
+def noiseFileBlocks(fileName, start, stop, rate, blockSize=blockSize):
+    # samples [start, stop) of a noise file counted at 'rate'
+    with sf.SoundFile(fileName) as f:
+        fs = f.samplerate
+        f.seek(start * fs // rate)
+        resampler = ResamplerStage(fs, rate)
+        n = stop - start
+        for x in f.blocks(blocksize=blockSize, dtype='float32', always_2d=True, frames=-(-n * fs // rate)):
+            yield resampler.process(toMono(x))
+        yield resampler.flush()
+
+
+def noiseRMS(noise, n, blockSize=blockSize):
+    # RMS amplitude of the first n samples of a NoiseLoop or of a generator of
+    # blocks, read block by block
+    sq, done = 0.0, 0
+    blocks = (noise.read(min(blockSize, n - i)) for i in range(0, n, blockSize)) if hasattr(noise, 'read') else noise
+    for x in blocks:
+        x = x[:n - done]
+        sq += float(np.dot(x.astype(np.float64), x))
+        done += len(x)
+        if done >= n:
+            break
+    return float(np.sqrt(sq / n)) if n else 0.0
+
+
+class NoiseStage(Stage):
+    # adds 'scaling' times the noise read from 'noise', either an
+    # audioengine.NoiseLoop or a generator of float32 blocks
+    def __init__(self, noise, scaling):
+        self.scaling = scaling
+        if hasattr(noise, 'read'):
+            self.loop, self.blocks = noise, None
+        else:
+            self.loop, self.blocks = None, noise
+        self.buf = empty
+
+    def read(self, n):
+        if self.loop is not None:
+            return self.loop.read(n)
+        while len(self.buf) < n:
+            x = next(self.blocks, None)
+            if x is None:
+                break
+            self.buf = np.concatenate([self.buf, x])
+        x, self.buf = self.buf[:n], self.buf[n:]
+        return x
+
+    def process(self, x):
+        return audioengine.mixNoise(x, self.read(len(x)), self.scaling)
+
+
+class CodecStage(Stage):
+    # a codec run block by block through codecbackend.openStream(), at the
+    # rate of the codec. The output is trimmed and padded to the length of
+    # the input, as encodeDecode() does.
+    def __init__(self, codec, rate, opts):
+        codecRate = codecbackend.codecRates[codec]
+        self.stream = codecbackend.openStream(codec, codecRate, opts)
+        self.down = ResamplerStage(rate, codecRate)
+        self.up = ResamplerStage(codecRate, rate)
+        self.nIn = 0
+        self.nOut = 0
+
+    def code(self, x):
+        return self.up.process(codecbackend.fromInt16(self.stream.process(codecbackend.toInt16(x))))
+
+    def emit(self, y):
+        y = y[:self.nIn - self.nOut]
+        self.nOut += len(y)
+        return audioengine.clip(y)
+
+    def process(self, x):
+        self.nIn += len(x)
+        return self.emit(self.code(self.down.process(x)))
+
+    def flush(self):
+        y = np.concatenate([self.code(self.down.flush()),
+                            self.up.process(codecbackend.fromInt16(self.stream.flush())),
+                            self.up.flush()])
+        # codecs may drop samples at the end (partial frames)
+        y = np.concatenate([self.emit(y), np.zeros(self.nIn - self.nOut, dtype=np.float32)])
+        self.nOut = self.nIn
+        return y
+
+
+class AudioWriter:
+    def __init__(self, fileName, rate):
+        fmt = os.path.splitext(fileName)[1][1:].upper()
+        subtype = 'PCM_16' if sf.check_format(fmt, 'PCM_16') else None
+        self.f = sf.SoundFile(fileName, 'w', samplerate=rate, channels=1, subtype=subtype)
+
+    def write(self, x):
+        self.f.write(audioengine.clip(x))
+
+    def close(self):
+        self.f.close()
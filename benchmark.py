@@ -0,0 +1,249 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Benchmark of the degradation pipeline on synthetic data: speech-like
+# signals, pink noise recordings and decaying-noise impulse responses are
+# generated in a temporary directory, so neither the NIST data nor the
+# freesound noise database are needed. The results are written as JSON and
+# can be compared with the results of another version (-c).
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+import audioengine
+from degradation import Resources, degrade, degradationVersion, getNoiseLoop, scriptDir
+from irbank import writeBank
+from noisepack import packNoise
+
+# representative chains; codecs other than the engine steps are pass-through
+conditions = {
+    'clean': 'norm[rms=-26]',
+    'noisy': 'norm[rms=-26]:noise[snr=10]',
+    'landline': 'norm[rms=-26]:noise[snr=15]:bp[cutoff=300-3400]:g711[law=u]',
+    'interview': 'norm[rms=-26]:irspace:irdevice:noise[snr=15]:mp3[bitrate=32]',
+    'playback': 'norm[rms=-26]:irdevice[wet=70]:irspace:aac[bitrate=32]',
+}
+
+
+def speechLike(rng, rate, seconds):
+    # harmonic source with a gliding pitch, 4 Hz syllabic envelope and pauses
+    t = np.arange(int(rate * seconds)) / rate
+    f0 = 120 + 30 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(f0) / rate
+    x = sum(np.sin(k * phase) / k for k in range(1, 25) if k * 300 < rate / 2)
+    env = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)**0.5
+    gate = np.floor(t / 1.5) % 3 != 2
+    x = x * env * gate + 1e-4 * rng.standard_normal(len(t))
+    return (0.2 * x / np.max(np.abs(x))).astype(np.float32)
+
+
+def pinkNoise(rng, rate, seconds):
+    n = int(rate * seconds)
+    X = np.fft.rfft(rng.standard_normal(n))
+    X[1:] /= np.sqrt(np.arange(1, len(X)))
+    x = np.fft.irfft(X, n)
+    return (0.1 * x / np.sqrt(np.mean(x**2))).clip(-1, 1).astype(np.float32)
+
+
+def syntheticIR(rng, rate, rt60):
+    n = int(rate * rt60)
+    h = rng.standard_normal(n) * np.exp(-6.9 * np.arange(n) / n)
+    h[0] = 4
+    return (h / np.sqrt(np.sum(h**2))).astype(np.float32)
+
+
+def makeData(dataDir, rng, seconds, nNoise=4):
+    noiseFiles = []
+    for i in range(nNoise):
+        fileName = os.path.join(dataDir, f'noise{i}.wav')
+        sf.write(fileName, pinkNoise(rng, 44100, seconds * 2), 44100, subtype='PCM_16')
+        noiseFiles.append(fileName)
+    with open(os.path.join(dataDir, 'noise-file-list.txt'), 'w', encoding='utf-8') as f:
+        f.write(''.join(f'{n}\n' for n in noiseFiles))
+    packNoise(noiseFiles, os.path.join(dataDir, 'noise-pack'))
+
+    irs = [(f'devices/synth/d{i}', 'devices', 0.01) for i in range(3)] + \
+          [(f'spaces/small/synth/s{i}', 'spaces/small', 0.4) for i in range(3)]
+    for rate in (8000, 16000):
+        writeBank(os.path.join(dataDir, 'ir-bank'), rate, [(name, cat, syntheticIR(rng, rate, rt60)) for name, cat, rt60 in irs])
+    for listName, cat in (('ir-device-file-list.txt', 'devices'), ('ir-space-file-list.txt', 'spaces/small')):
+        with open(os.path.join(dataDir, listName), 'w', encoding='utf-8') as f:
+            f.write(''.join(f'{name}\n' for name, c, _ in irs if c == cat))
+
+    inputFiles = []
+    for i in range(8):
+        fileName = os.path.join(dataDir, f'speech{i}.wav')
+        sf.write(fileName, speechLike(rng, 16000, seconds), 16000, subtype='PCM_16')
+        inputFiles.append(fileName)
+    return inputFiles
+
+
+def resourceArgs(dataDir):
+    return dict(noiseList=os.path.join(dataDir, 'noise-file-list.txt'),
+                deviceIRList=os.path.join(dataDir, 'ir-device-file-list.txt'),
+                spaceIRList=os.path.join(dataDir, 'ir-space-file-list.txt'),
+                noiseIndex=os.path.join(dataDir, 'noise-stats.txt'),
+                noisePack=os.path.join(dataDir, 'noise-pack'),
+                irBank=os.path.join(dataDir, 'ir-bank'), randomFile=os.path.join(scriptDir, 'random'))
+
+
+def timeIt(f, repeats):
+    # one untimed run first, e.g. for the noise index and IR spectra
+    f()
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t)
+    return dict(min=min(times), median=float(np.median(times)))
+
+
+workerResources = None
+
+
+def initWorker(args):
+    global workerResources
+    workerResources = Resources(**args)
+
+
+def runJob(job):
+    fileIn, outputFile, chain, seed = job
+    with contextlib.redirect_stdout(io.StringIO()):
+        degrade(fileIn, outputFile, chain, seed, workerResources, samplerate=8000)
+
+
+def runBenchmarks(dataDir, seconds, repeats, maxJobs):
+    rng = np.random.default_rng(1)
+    rate = 16000
+    inputFiles = makeData(dataDir, rng, seconds)
+    args = resourceArgs(dataDir)
+    resources = Resources(**args)
+    x, _ = audioengine.loadAudio(inputFiles[0], rate)
+    results = []
+
+    def add(name, f, audioSec=seconds, **params):
+        r = dict(name=name, **params, **timeIt(f, repeats))
+        r['rtf'] = r['median'] / audioSec
+        results.append(r)
+        print(f'{name:<36} {r["median"] * 1000:>10.2f} ms  RTF {r["rtf"]:.4f}')
+
+    def speechLevel():
+        meter = audioengine.SpeechLevelMeter(rate)
+        meter.process(x)
+        return meter.result()
+
+    add('getAudioStats', lambda: audioengine.getAudioStats(x, rate))
+    add('getSpeechRMSAmp', speechLevel)
+
+    pack = resources.getNoisePack(rate)
+    noiseFiles = resources.noiseFiles
+
+    def mixRandom(pack):
+        noiseFile = noiseFiles[rng.integers(len(noiseFiles))]
+        start = int(rng.integers(seconds * rate))
+        audioengine.mixNoiseSNR(x, getNoiseLoop(noiseFile, pack, rate, start, len(x)), 0.05, 10)
+    add('mixNoiseSNR (pack, random offset)', lambda: mixRandom(pack))
+    add('mixNoiseSNR (file, random offset)', lambda: mixRandom(None))
+
+    add('applyBandpass 300-3400', lambda: audioengine.applyBandpass(x, rate, 300, 3400))
+    irStore = resources.getIRStore()
+    add('applyIR device', lambda: audioengine.applyIR(x, rate, irStore, 'devices/synth/d0'))
+    add('applyIR space', lambda: audioengine.applyIR(x, rate, irStore, 'spaces/small/synth/s0'))
+    for rateIn, rateOut in ((16000, 8000), (8000, 16000), (44100, 16000)):
+        y = audioengine.resample(x, rate, rateIn)
+        add(f'resample {rateIn}->{rateOut}', lambda y=y, a=rateIn, b=rateOut: audioengine.resample(y, a, b))
+
+    outDir = os.path.join(dataDir, 'out')
+    os.makedirs(outDir, exist_ok=True)
+    for backend in ('numpy', 'stream'):
+        for cond, chain in conditions.items():
+            def run(cond=cond, chain=chain, backend=backend):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    degrade(inputFiles[0], os.path.join(outDir, f'{cond}.wav'), chain, '1', resources,
+                            samplerate=8000, backend=backend)
+            add(f'degrade {cond} ({backend})', run, backend=backend, chain=chain)
+
+    # batch throughput: every input file in every condition
+    jobs = [(f, os.path.join(outDir, f'{os.path.basename(f)}-{cond}.wav'), chain, str(n))
+            for n, (f, (cond, chain)) in enumerate((f, c) for f in inputFiles for c in conditions.items())]
+    audioSec = seconds * len(jobs)
+    for nJobs in sorted({2**k for k in range(maxJobs.bit_length()) if 2**k <= maxJobs} | {maxJobs}):
+        def batch(nJobs=nJobs):
+            with ProcessPoolExecutor(max_workers=nJobs, initializer=initWorker, initargs=(args,)) as executor:
+                list(executor.map(runJob, jobs))
+        add(f'batch -j {nJobs}', batch, audioSec=audioSec, jobs=nJobs, files=len(jobs))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    old = {(r['name'], r.get('backend')): r for r in baseline['results']}
+    nSlower = 0
+    print(f'\n{"benchmark":<36} {"old ms":>10} {"new ms":>10} {"ratio":>7}')
+    for r in results:
+        o = old.get((r['name'], r.get('backend')))
+        if o is None:
+            continue
+        ratio = r['median'] / o['median']
+        flag = ' slower' if ratio > 1 + tolerance else ''
+        nSlower += bool(flag)
+        print(f'{r["name"]:<36} {o["median"] * 1000:>10.2f} {r["median"] * 1000:>10.2f} {ratio:>7.2f}{flag}')
+    return nSlower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-t", dest="seconds", type=float, default=30, help="Length of the synthetic speech signals in seconds")
+    parser.add_argument("-r", dest="repeats", type=int, default=5, help="Repetitions of every benchmark (the median is reported)")
+    parser.add_argument("-j", dest="jobs", type=int, default=os.cpu_count(), help="Largest number of jobs of the batch benchmark")
+    parser.add_argument("-o", dest="output", default='benchmark.json', help="Results file (JSON)")
+    parser.add_argument("-c", dest="baseline", default=None, help="Results of another version to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    options = parser.parse_args()
+
+    dataDir = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        results = runBenchmarks(dataDir, options.seconds, options.repeats, options.jobs)
+    finally:
+        shutil.rmtree(dataDir)
+
+    meta = dict(degradationVersion=degradationVersion, python=platform.python_version(), numpy=np.__version__,
+                machine=platform.machine(), cpus=os.cpu_count(), seconds=options.seconds, repeats=options.repeats,
+                date=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    with open(options.output, 'w', encoding='utf-8') as f:
+        json.dump(dict(meta=meta, results=results), f, indent=1)
+    print(f'results written to {options.output}')
+
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            nSlower = compare(results, json.load(f), options.tolerance)
+        sys.exit(1 if nSlower else 0)
@@ -0,0 +1,438 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Codec steps of the chain behind one interface:
+#
+#   y = encodeDecode(x, rate, codec, opts)
+#
+# x is a float32 signal at 'rate'; it is resampled to the rate of the codec,
+# encoded and decoded, and resampled back, and y has the length of x. A
+# backend is created once per process and reused for every file:
+#   - G.711 is computed in process (the companders of the ITU STL g711.c)
+#   - SILK uses libopus through ctypes when it is installed (the encoder and
+#     decoder states are kept and reset between files), else opus_demo
+#   - the other codecs run the binaries built as in README-codecs.txt (and
+#     sox/ffmpeg for GSM-FR, CVSD, MP3 and AAC) through pipes and memory
+#     files, without temporary files
+#
+# openStream() codes a signal block by block, for the stream backend: G.711,
+# SILK through libopus and the sox/ffmpeg codecs (stdin to stdout pipes).
+# The binaries reading and writing files need the whole signal
+# (streamable(codec) is False).
+
+import ctypes
+import ctypes.util
+import os
+import re
+import shutil
+
+import numpy as np
+
+from pipeline import PipeStream, runPipeline
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+srcDir = os.path.join(scriptDir, 'src')
+stlDir = os.path.join(srcDir, 'Software', 'stl2009')
+
+int16Max = 32767 / 32768
+
+soxBin = ['sox', '-V1']
+ffmpegBin = ['ffmpeg', '-v', 'error', '-y']
+
+# sample rate at which each codec runs
+codecRates = {
+    'g711': 8000, 'g726': 8000, 'g728': 8000, 'g729a': 8000, 'g722': 16000,
+    'amr': 8000, 'amrwb': 16000, 'gsmfr': 8000, 'c2': 8000, 'cvsd': 8000,
+    'silk': 8000, 'silkwb': 16000, 'mp3': 16000, 'aac': 16000,
+}
+
+amrModes = ['MR475', 'MR515', 'MR59', 'MR67', 'MR74', 'MR795', 'MR102', 'MR122']
+
+
+def getOpt(opts, name, default):
+    m = re.search(rf'{name}=([^,]+)', opts)
+    return m.group(1) if m else default
+
+
+def toInt16(x):
+    return np.round(np.clip(x, -1.0, int16Max) * 32768).astype('<i2')
+
+
+def fromInt16(s):
+    return s.astype(np.float32) / 32768
+
+
+def bitLength(a):
+    # number of bits of the non-negative integers of a
+    return np.frexp(a.astype(np.float64))[1]
+
+
+class G711Codec:
+    # ITU-T G.711 A-law and u-law, bit-exact with alaw_compress/alaw_expand
+    # and ulaw_compress/ulaw_expand of the STL
+    def available(self):
+        return True
+
+    def version(self):
+        return 'g711-numpy'
+
+    def streams(self, codec):
+        return True
+
+    def stream(self, rate, codec, opts):
+        return BlockStream(self, rate, codec, opts)
+
+    def alaw(self, lin):
+        ix = np.where(lin < 0, ~lin, lin) >> 4
+        iexp = np.maximum(bitLength(ix) - 4, 1)
+        ix = np.where(ix > 15, (ix >> (iexp - 1)) - 16 + (iexp << 4), ix)
+        ix = np.where(lin >= 0, ix | 0x80, ix) ^ 0x55
+        # expand
+        ix2 = (ix ^ 0x55) & 0x7F
+        iexp = ix2 >> 4
+        mant = ix2 & 0x0F
+        mant = np.where(iexp > 0, mant + 16, mant)
+        mant = (mant << 4) + 0x08
+        mant = np.where(iexp > 1, mant << np.maximum(iexp - 1, 0), mant)
+        return np.where(ix > 127, mant, -mant)
+
+    def ulaw(self, lin):
+        absno = np.minimum(np.where(lin < 0, ~lin, lin) >> 2, 0x1FFF - 33) + 33
+        segno = bitLength(absno >> 6) + 1
+        low = 0x0F - ((absno >> segno) & 0x0F)
+        log = ((0x08 - segno) << 4) | low
+        log = np.where(lin >= 0, log | 0x80, log)
+        # expand
+        sign = np.where(log < 0x80, -1, 1)
+        mant = ~log
+        exponent = (mant >> 4) & 0x07
+        step = 4 << (exponent + 1)
+        return sign * ((0x80 << exponent) + step * (mant & 0x0F) + step // 2 - 4 * 33)
+
+    def encodeDecode(self, s, rate, codec, opts):
+        lin = s.astype(np.int32)
+        return (self.alaw(lin) if getOpt(opts, 'law', 'u') == 'a' else self.ulaw(lin)).astype('<i2')
+
+
+class OpusCodec:
+    # SILK through libopus, forced to SILK-only mode; falls back to opus_demo
+    # (built in src/opus-1.1) when the library is not installed
+    applicationVoip = 2048
+    setBitrate, setBandwidth, getLookahead, resetState, setForceMode = 4002, 4008, 4027, 4028, 11002
+    bandwidths = {8000: 1101, 16000: 1103}
+    modeSilkOnly = 1000
+
+    def __init__(self):
+        name = ctypes.util.find_library('opus')
+        self.lib = ctypes.CDLL(name) if name else None
+        self.demoBin = os.path.join(srcDir, 'opus-1.1', 'opus_demo')
+        # (encoder, decoder) per rate, kept for the life of the process
+        self.states = {}
+
+    def available(self):
+        return self.lib is not None or os.path.exists(self.demoBin)
+
+    def version(self):
+        if self.lib is None:
+            return fileVersion(self.demoBin)
+        self.lib.opus_get_version_string.restype = ctypes.c_char_p
+        return self.lib.opus_get_version_string().decode('ascii')
+
+    def createStates(self, rate):
+        err = ctypes.c_int()
+        self.lib.opus_encoder_create.restype = ctypes.c_void_p
+        self.lib.opus_decoder_create.restype = ctypes.c_void_p
+        enc = self.lib.opus_encoder_create(rate, 1, self.applicationVoip, ctypes.byref(err))
+        dec = self.lib.opus_decoder_create(rate, 1, ctypes.byref(err))
+        if not enc or not dec:
+            raise RuntimeError(f'libopus error {err.value}')
+        return ctypes.c_void_p(enc), ctypes.c_void_p(dec)
+
+    def getStates(self, rate):
+        if rate not in self.states:
+            self.states[rate] = self.createStates(rate)
+        return self.states[rate]
+
+    def streams(self, codec):
+        return self.lib is not None
+
+    def stream(self, rate, codec, opts):
+        # with states of its own, as several streams may be open at once
+        return OpusStream(self, self.createStates(rate), rate, codec, opts, owned=True)
+
+    def encodeDecode(self, s, rate, codec, opts):
+        if self.lib is None:
+            bitrate = int(getOpt(opts, 'bitrate', '10' if codec == 'silk' else '20')) * 1000
+            return self.encodeDecodeDemo(s, rate, bitrate)
+        st = OpusStream(self, self.getStates(rate), rate, codec, opts)
+        return np.concatenate([st.process(s), st.flush()])[:len(s)]
+
+    def encodeDecodeDemo(self, s, rate, bitrate):
+        bandwidth = 'NB' if rate == 8000 else 'WB'
+        return runCommands(s, [[self.demoBin, 'voip', str(rate), '1', str(bitrate), '-bandwidth', bandwidth, '{in}', '{out}']])
+
+
+class OpusStream:
+    # SILK frame by frame (20 ms); the output is delayed by the lookahead of
+    # the encoder, which is dropped, and flush() pads the input with zeros so
+    # that the lookahead is flushed out
+    def __init__(self, opus, states, rate, codec, opts, owned=False):
+        self.lib = opus.lib
+        self.enc, self.dec = states
+        self.owned = owned
+        bitrate = int(getOpt(opts, 'bitrate', '10' if codec == 'silk' else '20')) * 1000
+        self.lib.opus_encoder_ctl(self.enc, opus.resetState)
+        self.lib.opus_decoder_ctl(self.dec, opus.resetState)
+        self.lib.opus_encoder_ctl(self.enc, opus.setBitrate, ctypes.c_int(bitrate))
+        self.lib.opus_encoder_ctl(self.enc, opus.setBandwidth, ctypes.c_int(opus.bandwidths[rate]))
+        self.lib.opus_encoder_ctl(self.enc, opus.setForceMode, ctypes.c_int(opus.modeSilkOnly))
+        lookahead = ctypes.c_int()
+        self.lib.opus_encoder_ctl(self.enc, opus.getLookahead, ctypes.byref(lookahead))
+        self.lookahead = self.skip = lookahead.value
+        self.frame = rate // 50
+        self.packet = ctypes.create_string_buffer(4000)
+        self.buf = np.zeros(0, dtype=np.int16)
+        self.nIn = 0
+
+    def code(self, x):
+        # whole frames
+        y = np.empty_like(x)
+        frame, packet = self.frame, self.packet
+        for i in range(0, len(x), frame):
+            nBytes = self.lib.opus_encode(self.enc, x[i:].ctypes.data_as(ctypes.POINTER(ctypes.c_int16)), frame, packet, len(packet))
+            if nBytes < 0:
+                raise RuntimeError(f'opus_encode error {nBytes}')
+            nOut = self.lib.opus_decode(self.dec, packet, nBytes, y[i:].ctypes.data_as(ctypes.POINTER(ctypes.c_int16)), frame, 0)
+            if nOut != frame:
+                raise RuntimeError(f'opus_decode error {nOut}')
+        d = min(self.skip, len(y))
+        self.skip -= d
+        return y[d:]
+
+    def process(self, s):
+        self.nIn += len(s)
+        x = np.concatenate([self.buf, s.astype(np.int16)])
+        n = len(x) // self.frame * self.frame
+        self.buf = x[n:]
+        return self.code(x[:n])
+
+    def flush(self):
+        total = -(-(self.nIn + self.lookahead) // self.frame) * self.frame
+        x = np.zeros(total - (self.nIn - len(self.buf)), dtype=np.int16)
+        x[:len(self.buf)] = self.buf
+        self.buf = x[:0]
+        y = self.code(x)
+        if self.owned:
+            self.lib.opus_encoder_destroy(self.enc)
+            self.lib.opus_decoder_destroy(self.dec)
+            self.owned = False
+        return y
+
+
+class BlockStream:
+    # a memoryless codec (G.711), block by block
+    def __init__(self, backend, rate, codec, opts):
+        self.backend, self.rate, self.codec, self.opts = backend, rate, codec, opts
+
+    def process(self, s):
+        return self.backend.encodeDecode(s, self.rate, self.codec, self.opts)
+
+    def flush(self):
+        return np.zeros(0, dtype='<i2')
+
+
+class CommandStream:
+    # raw 16-bit samples through the pipes of a pipeline.PipeStream
+    def __init__(self, commands):
+        self.pipe = PipeStream(commands)
+        self.rest = b''
+
+    def samples(self, data):
+        data = self.rest + data
+        n = len(data) // 2 * 2
+        self.rest = data[n:]
+        return np.frombuffer(data[:n], dtype='<i2')
+
+    def process(self, s):
+        return self.samples(self.pipe.write(s.tobytes()))
+
+    def flush(self):
+        return self.samples(self.pipe.close())
+
+
+def fileVersion(binary):
+    # a build of a tool: its path, size and modification time
+    path = binary if os.path.exists(binary) else shutil.which(binary)
+    st = os.stat(path)
+    return f'{path}:{st.st_size}:{st.st_mtime_ns}'
+
+
+def runCommands(s, commands):
+    # raw 16-bit samples through the commands, in memory (see pipeline.py)
+    return np.frombuffer(runPipeline(commands, s.tobytes()), dtype='<i2')
+
+
+class CommandCodec:
+    # a codec run by external programs; 'commands' gives the argument lists
+    # of the encoder and the decoder for the options of the step
+    def __init__(self, binaries, commands):
+        self.binaries = binaries
+        self.commands = commands
+
+    def available(self):
+        return all(os.path.exists(b) or shutil.which(b) for b in self.binaries)
+
+    def version(self):
+        return ','.join(fileVersion(b) for b in self.binaries)
+
+    def streams(self, codec):
+        # tools reading and writing memory files ('{in}', '{out}') need the
+        # whole signal; stdin to stdout tools are fed block by block
+        return not any('{' in a for cmd in self.commands(codecRates[codec], '') for a in cmd)
+
+    def stream(self, rate, codec, opts):
+        return CommandStream(self.commands(rate, opts))
+
+    def encodeDecode(self, s, rate, codec, opts):
+        return runCommands(s, self.commands(rate, opts))
+
+
+def g711Bin():
+    return os.path.join(stlDir, 'g711', 'g711demo')
+
+
+def g726Commands(rate, opts):
+    law = getOpt(opts, 'law', 'u')
+    bitrate = getOpt(opts, 'bitrate', '32')
+    g726 = os.path.join(stlDir, 'g726', 'g726demo')
+    return [[g711Bin(), law, 'lilo', '{in}', '{out}', '160'],
+            [g726, law, 'lolo', bitrate, '{in}', '{out}', '160'],
+            [g711Bin(), law, 'loli', '{in}', '{out}', '160']]
+
+
+def soxCommands(fmt):
+    def commands(rate, opts):
+        raw = ['-t', 'raw', '-e', 'signed-integer', '-b', '16', '-c', '1', '-r', str(rate)]
+        return [soxBin + raw + ['-', '-t', fmt, '-'],
+                soxBin + ['-t', fmt, '-'] + raw + ['-']]
+    return commands
+
+
+def ffmpegCommands(encoder, fmt):
+    def commands(rate, opts):
+        raw = ['-f', 's16le', '-ar', str(rate), '-ac', '1']
+        return [ffmpegBin + raw + ['-i', 'pipe:0', '-c:a', encoder, '-b:a', f'{getOpt(opts, "bitrate", "32")}k', '-f', fmt, 'pipe:1'],
+                ffmpegBin + ['-f', fmt, '-i', 'pipe:0'] + raw + ['pipe:1']]
+    return commands
+
+
+def codecBinaries():
+    amrnb = os.path.join(srcDir, 'amr-nb')
+    amrwb = os.path.join(srcDir, 'G722-2AnxC-v.7.1.0', 'c-code-v.7.1.0')
+    g729a = os.path.join(srcDir, 'Software', 'G729_Release3', 'g729AnnexA', 'c_code')
+    g728 = os.path.join(stlDir, 'g728', 'g728fixed', 'g728fp')
+    codec2 = os.path.join(srcDir, 'codec2', 'build_linux', 'src')
+    return dict(
+        g726=([g711Bin(), os.path.join(stlDir, 'g726', 'g726demo')], g726Commands),
+        g722=([os.path.join(stlDir, 'g722', 'encg722'), os.path.join(stlDir, 'g722', 'decg722')],
+              lambda rate, opts: [[os.path.join(stlDir, 'g722', 'encg722'), '{in}', '{out}'],
+                                  [os.path.join(stlDir, 'g722', 'decg722'), '{in}', '{out}']]),
+        g728=([g728], lambda rate, opts: [[g728, '-c', '{in}', '{out}'], [g728, '-d', '{in}', '{out}']]),
+        g729a=([os.path.join(g729a, 'coder'), os.path.join(g729a, 'decoder')],
+               lambda rate, opts: [[os.path.join(g729a, 'coder'), '{in}', '{out}'],
+                                   [os.path.join(g729a, 'decoder'), '{in}', '{out}']]),
+        amr=([os.path.join(amrnb, 'encoder'), os.path.join(amrnb, 'decoder')],
+             lambda rate, opts: [[os.path.join(amrnb, 'encoder'), amrModes[int(getOpt(opts, 'mode', '7'))], '{in}', '{out}'],
+                                 [os.path.join(amrnb, 'decoder'), '{in}', '{out}']]),
+        amrwb=([os.path.join(amrwb, 'coder'), os.path.join(amrwb, 'decoder')],
+               lambda rate, opts: [[os.path.join(amrwb, 'coder'), getOpt(opts, 'mode', '8'), '{in}', '{out}'],
+                                   [os.path.join(amrwb, 'decoder'), '{in}', '{out}']]),
+        c2=([os.path.join(codec2, 'c2enc'), os.path.join(codec2, 'c2dec')],
+            lambda rate, opts: [[os.path.join(codec2, 'c2enc'), getOpt(opts, 'bitrate', '2400'), '{in}', '{out}'],
+                                [os.path.join(codec2, 'c2dec'), getOpt(opts, 'bitrate', '2400'), '{in}', '{out}']]),
+        gsmfr=([soxBin[0]], soxCommands('gsm')),
+        cvsd=([soxBin[0]], soxCommands('cvsd')),
+        mp3=([ffmpegBin[0]], ffmpegCommands('libmp3lame', 'mp3')),
+        aac=([ffmpegBin[0]], ffmpegCommands('aac', 'adts')),
+    )
+
+
+# backends by codec, created on first use
+backends = {}
+
+
+def getBackend(codec):
+    if codec not in backends:
+        if codec == 'g711':
+            backends[codec] = G711Codec()
+        elif codec in ('silk', 'silkwb'):
+            backends[codec] = backends.get('silk') or backends.get('silkwb') or OpusCodec()
+        elif codec in codecBinaries():
+            backends[codec] = CommandCodec(*codecBinaries()[codec])
+        else:
+            return None
+    return backends[codec]
+
+
+def available(codec):
+    backend = getBackend(codec)
+    return backend is not None and backend.available()
+
+
+def version(codec):
+    # what a codec step depends on besides its options, for the cache keys:
+    # 'unavailable' when the step is passed through, else the version of its
+    # implementation
+    if not available(codec):
+        return 'unavailable'
+    return getBackend(codec).version()
+
+
+def chainVersion(chain):
+    # version() of the codecs of a chain ('codec[opts]:codec[opts]...')
+    codecs = [re.sub(r'\[.*\]', '', c) for c in chain.split(':')] if chain else []
+    return ';'.join(f'{c}={version(c)}' for c in codecs if c in codecRates)
+
+
+def streamable(codec):
+    # whether openStream() can code the codec block by block
+    return available(codec) and getBackend(codec).streams(codec)
+
+
+def openStream(codec, rate, opts=''):
+    # int16 samples at 'rate' (the rate of the codec) coded block by block:
+    # y = stream.process(s) for every block, then stream.flush()
+    if not streamable(codec):
+        raise ValueError(f'codec {codec} cannot be run block by block')
+    return getBackend(codec).stream(rate, codec, opts)
+
+
+def encodeDecode(x, rate, codec, opts=''):
+    import audioengine
+
+    codecRate = codecRates[codec]
+    s = toInt16(audioengine.resample(x, rate, codecRate))
+    s = getBackend(codec).encodeDecode(s, codecRate, codec, opts)
+    y = audioengine.resample(fromInt16(s), codecRate, rate)
+    # codecs may add or drop samples at the end (partial frames)
+    if len(y) < len(x):
+        y = np.concatenate([y, np.zeros(len(x) - len(y), dtype=np.float32)])
+    return audioengine.clip(y[:len(x)].astype(np.float32))
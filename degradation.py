@@ -0,0 +1,500 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Library API of degrade-audio-safe-random.py. A Resources object loads the
+# noise/IR lists, the random table and the noise statistics once, and can be
+# reused across any number of degrade() calls:
+#
+#   resources = Resources(noiseList='noise-file-list-dev.txt')
+#   degrade('in.sph', 'out.wav', 'norm[rms=-26]:noise[snr=15]', seed=12, resources=resources)
+
+import hashlib
+import os
+import re
+import tempfile
+
+import numpy as np
+
+import codecbackend
+from filterbank import filterBank, filterVersion
+from irbank import bankFiles
+from noisecatalog import NoiseCatalog
+from noiseindex import NoiseIndex
+from noisepack import NoisePack, packFiles
+from pipeline import runPipeline
+from saferandom import SafeRandom, loadTable
+from sphere import SphereReader, splitChannel
+from steplog import StepLog
+
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+
+soxBin = ['sox', '-V1']
+sph2pipeBin = ['sph2pipe']
+
+# part of the result cache key: increase it whenever the output of a chain changes
+degradationVersion = 4
+
+# fixed filters of filterbank.py, applied as chain steps without options
+maskFilters = ('g712', 'p341', 'irs', 'mirs')
+
+codecStr = (
+    '\n'
+    '\n\'noise[opts]\': Add noise (opts: filter=keyword, snr=snr(dB), irspace=keyword, wet=(0-100))\n'
+    '\'norm[opts]\': Normalize audio (opts: rms=level(dB))\n'
+    '\'bp[opts]\': Apply bandpass filter (opts: cutoff=freqLo-freqHi(Hz))\n'
+    '\'g712\': ITU-T G.712 telephone channel band-pass filter (300-3400 Hz)\n'
+    '\'p341\': ITU-T P.341 wideband send filter (50-7000 Hz)\n'
+    '\'irs\': ITU-T P.48 IRS send filter\n'
+    '\'mirs\': ITU-T P.830 modified IRS send filter\n'
+    '\'irdevice[opts]\': Convolve with a device impulse response (opts: filter=keyword, wet=(0-100))\n'
+    '\'irspace[opts]\': Convolve with a space impulse response (opts: filter=keyword, wet=(0-100))\n'
+    '\'amr[opts]\': AMR narrowband codec (opts: mode=[0-7])\n'
+    '\'amrwb[opts]\': AMR wideband codec (opts: mode=[0-8])\n'
+    '\'g711[opts]\': G.711 codec (opts: law=[u|a])\n'
+    '\'g726[opts]\': G.726 codec (opts: bitrate=[16|24|32|40])\n'
+    '\'g729a\': G.729a codec\n'
+    '\'g722\': G.722 codec\n'
+    '\'g728\': G.728 codec\n'
+    '\'c2\': C2 codec\n'
+    '\'cvsd\': CVSD codec\n'
+    '\'silk[opts]\': SILK codec (opts: bitrate=[5|10|15|20])\n'
+    '\'silkwb[opts]\': SILK wideband codec (opts: bitrate=[10|20|30|40])\n'
+    '\'gsmfr\': GSM-FR codec\n'
+    '\'mp3[opts]\': MP3 codec (opts: bitrate=[8|16|24|32|40|48|56|64])\n'
+    '\'aac[opts]\': AAC codec (opts: bitrate=[8|16|24|32|40|48|56|64])\n'
+)
+
+
+def fileStamps(fileNames):
+    # size and modification time of the files ('-' for missing ones)
+    stamps = []
+    for fileName in fileNames:
+        if os.path.exists(fileName):
+            st = os.stat(fileName)
+            stamps.append(f'{fileName}:{st.st_size}:{st.st_mtime_ns}')
+        else:
+            stamps.append(f'{fileName}:-')
+    return stamps
+
+
+def resourceStamps(noiseFiles, noisePack, irBank, rates=(8000, 16000)):
+    # stamps of the noise files (a file may be replaced at the same path) and
+    # of the files rebuilt in place by noisepack.py and
+    # prepare-impulse-responses.py. The noise index is left out: it is a cache
+    # of the noise statistics, rewritten by save() as entries are added.
+    return fileStamps(list(noiseFiles) + [f for rate in rates for f in packFiles(noisePack, rate) + bankFiles(irBank, rate)])
+
+
+def readList(fileName):
+    if not os.path.exists(fileName):
+        return []
+    with open(fileName, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class Resources:
+    def __init__(self, noiseList='noise-file-list.txt', deviceIRList='ir-device-file-list.txt',
+                 spaceIRList='ir-space-file-list.txt', noiseIndex='noise-stats.txt',
+                 noisePack='noise-pack', irBank='impulse-responses/ir-bank', randomFile='random', stageCache=None,
+                 noiseDb='noise-db.txt', noiseTypeList='noise-type-list.txt'):
+        self.rnd = loadTable(randomFile)
+        self.noiseFiles = readList(noiseList)
+        self.deviceIRs = readList(deviceIRList)
+        self.spaceIRs = readList(spaceIRList)
+        self.noiseIndex = NoiseIndex(noiseIndex)
+        self.noiseCatalog = NoiseCatalog(self.noiseFiles, noiseDb, noiseTypeList)
+        self.noisePackPrefix = noisePack
+        self.noisePacks = {}
+        self.irBankPrefix = irBank
+        self.irStore = None
+        # optional stagecache.StageCache for the numpy backend
+        self.stageCache = stageCache
+        self.fingerprint = hashlib.sha1('\n'.join([str(degradationVersion), str(filterVersion), irBank] +
+                                                  resourceStamps(self.noiseFiles, noisePack, irBank) + self.deviceIRs +
+                                                  self.spaceIRs + self.noiseCatalog.categories +
+                                                  [str(self.noiseCatalog.order.tolist())]).encode('utf-8')).hexdigest()
+
+    def getNoisePack(self, rate):
+        if rate not in self.noisePacks:
+            self.noisePacks[rate] = NoisePack.open(self.noisePackPrefix, rate)
+        return self.noisePacks[rate]
+
+    def getIRStore(self):
+        if self.irStore is None:
+            import audioengine
+            self.irStore = audioengine.IRStore(self.irBankPrefix)
+        return self.irStore
+
+    def save(self):
+        self.noiseIndex.save()
+
+
+def getCodecs(chain):
+    if not chain:
+        return [], []
+    codecs, opts = [], []
+    for c in chain.split(':'):
+        m = re.search(r'\[(.*)\]', c)
+        opts.append(m.group(1) if m else '')
+        codecs.append(re.sub(r'\[.*\]', '', c))
+    return codecs, opts
+
+
+def getSNR(opts, default=15):
+    m = re.search(r'snr=([0-9]+)', opts)
+    return float(m.group(1)) if m else default
+
+
+def getFilter(opts):
+    m = re.search(r'filter=([^,]+)', opts)
+    return m.group(1).split('|') if m else []
+
+
+def getWet(opts, default=100):
+    m = re.search(r'wet=([0-9]+)', opts)
+    return min(100, float(m.group(1))) if m else default
+
+
+def chooseIR(codec, opts, rs, resources):
+    irs = resources.deviceIRs if codec == 'irdevice' else resources.spaceIRs
+    keywords = getFilter(opts)
+    if keywords:
+        irs = [ir for ir in irs if any(kw in ir for kw in keywords)]
+    if not irs:
+        return None
+    return rs.randomChoice(irs)
+
+
+def getSpeechRMSAmp(raw):
+    # active speech level (ITU-T P.56) of raw 16-bit samples, computed in
+    # process
+    import audioengine
+
+    return audioengine.getSpeechRMSAmp(np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768, 16000)
+
+
+def firText(h):
+    # FIR coefficients in the text format of the sox 'fir' effect
+    return ''.join(f'{c:.8g}\n' for c in h).encode('ascii')
+
+
+def getNoiseLoop(noiseFile, noisePack, rate, start, n):
+    # n samples of noise from 'start' on; a noise that ends before is read
+    # whole and looped
+    import audioengine
+
+    if noisePack is not None and noiseFile in noisePack:
+        noise = noisePack.segment(noiseFile, 0, start + n)
+    else:
+        noise = audioengine.loadSegment(noiseFile, start, start + n, rate)
+        if len(noise) == n:
+            return audioengine.NoiseLoop(noise, 0, rate, fadeSec=0)
+        noise, _ = audioengine.loadAudio(noiseFile, rate)
+    return audioengine.NoiseLoop(noise, start, rate, fadeSec=0 if start + n <= len(noise) else 0.05)
+
+
+def degradeSox(fileIn, outputFile, chain, rs, resources, samplerate='auto', debug=False, log=None):
+    # the signal stays in memory as raw 16-bit samples and the tools are run
+    # through pipes and memory files (see pipeline.py); with debug, the output
+    # of every step is also written to a directory in tmp
+    if log is None:
+        log = StepLog(enabled=False)
+    tmpDir = None
+    if debug:
+        os.makedirs(os.path.join(scriptDir, 'tmp'), exist_ok=True)
+        tmpDir = tempfile.mkdtemp(dir=os.path.join(scriptDir, 'tmp'))
+        print(f'intermediate files in {tmpDir}')
+
+    fileInRate = 16000
+    rawOpts = ['-t', 'raw', '-e', 'signed-integer', '-b', '16', '-r', str(fileInRate)]
+    toRaw = ['-G', '-V0', '-r', str(fileInRate), '-c', '1', '-t', 'raw', '-e', 'signed-integer', '-b', '16', '-', 'rate', '-h']
+    with log.step('decode'):
+        if os.path.splitext(fileIn)[1] == '.sph':
+            try:
+                # read natively, sox only resamples
+                reader = SphereReader(fileIn)
+                raw = b''.join(codecbackend.toInt16(x).tobytes() for x in reader.blocks())
+                if reader.rate != fileInRate:
+                    raw = runPipeline([soxBin + ['-t', 'raw', '-e', 'signed-integer', '-b', '16', '-r', str(reader.rate), '-'] + toRaw], raw)
+            except NotImplementedError:
+                path, channel = splitChannel(fileIn)
+                raw = runPipeline([sph2pipeBin + ['-p', '-f', 'rif', '-c', str(channel + 1), path], soxBin + ['-t', 'wav', '-'] + toRaw])
+        else:
+            raw = runPipeline([soxBin + [fileIn] + toRaw])
+
+    # speech level of 'raw' when known (after 'norm')
+    speechRMSAmp = None
+    for stepNo, (codec, opts) in enumerate(zip(*getCodecs(chain))):
+        print(f'\napplying {codec}')
+        with log.step(codec, opts):
+            level = None
+            if codec == 'noise':
+                if not resources.noiseFiles:
+                    print('no noise files available')
+                    continue
+                noiseFile = resources.noiseCatalog.choose(getFilter(opts), rs)
+                noiseStats = resources.noiseIndex.get(noiseFile)
+                lengthSecNoise, rmsAmpNoise = noiseStats.lengthSec, noiseStats.rmsAmp
+                nSamplesSpeech = len(raw) // 2
+                lengthSecSpeech = nSamplesSpeech / fileInRate
+                speechRMSAmp = speechRMSAmp or getSpeechRMSAmp(raw)
+                snr = getSNR(opts)
+                noiseScaling = speechRMSAmp / rmsAmpNoise / (10**(snr/20))
+                posStart = rs.getRandom(int(max(0, lengthSecNoise - lengthSecSpeech) * fileInRate))
+                posEnd = posStart + nSamplesSpeech
+                # the noise segment is piped into the mix, the speech is read from memory
+                raw = runPipeline([soxBin + [noiseFile, '-G'] + rawOpts + ['-', 'trim', str(posStart / fileInRate), str(posEnd / fileInRate)],
+                                   soxBin + ['-m'] + rawOpts + ['{speech}'] + rawOpts + ['-v', str(noiseScaling), '-'] + rawOpts + ['-']],
+                                  files={'speech': raw})
+            elif codec == 'norm':
+                m = re.search(r'rms=([-+]?[0-9]+)', opts)
+                if m:
+                    level = 10**(float(m.group(1))/20)
+                    gain = level / (speechRMSAmp or getSpeechRMSAmp(raw))
+                    raw = runPipeline([soxBin + rawOpts + ['-', '-G'] + rawOpts + ['-', 'vol', str(gain)]], raw)
+            elif codec == 'bp':
+                m = re.search(r'cutoff=([0-9]+)-([0-9]+)', opts)
+                if m:
+                    freqLo, freqHi = m.group(1), m.group(2)
+                    raw = runPipeline([soxBin + rawOpts + ['-'] + rawOpts + ['-', 'sinc', f'{freqLo}-{freqHi}']], raw)
+            elif codec in ('irdevice', 'irspace'):
+                irName = chooseIR(codec, opts, rs, resources)
+                if irName is None:
+                    print(f'no {codec} impulse responses available')
+                    continue
+                # sox reads the FIR coefficients from a text file; the sox backend
+                # always applies the IR fully wet
+                coefs = firText(resources.getIRStore().getIR(irName, fileInRate))
+                raw = runPipeline([soxBin + rawOpts + ['-', '-G'] + rawOpts + ['-', 'fir', '{fir}']], raw, files={'fir': coefs})
+            elif codec in maskFilters:
+                # the mask's coefficients, delay compensated like 'sinc'
+                h = filterBank.getTaps(codec, fileInRate)
+                d = f'{len(h) // 2}s'
+                raw = runPipeline([soxBin + rawOpts + ['-', '-G'] + rawOpts + ['-', 'fir', '{fir}', 'trim', d, 'pad', '0', d]],
+                                  raw, files={'fir': firText(h)})
+            elif codecbackend.available(codec):
+                x = codecbackend.fromInt16(np.frombuffer(raw, dtype='<i2'))
+                raw = codecbackend.toInt16(codecbackend.encodeDecode(x, fileInRate, codec, opts)).tobytes()
+            else:
+                print(f'codec {codec} not available, skipping')
+                continue
+            speechRMSAmp = level
+            if debug:
+                with open(os.path.join(tmpDir, f'{os.path.basename(fileIn)}-{stepNo}-{codec}.raw'), 'wb') as f:
+                    f.write(raw)
+
+    if samplerate == 'auto':
+        samplerate = fileInRate
+
+    outext = os.path.splitext(outputFile)[1][1:]
+    with log.step('write'):
+        runPipeline([soxBin + rawOpts + ['-', '-t', outext, '-r', str(samplerate), outputFile]], raw)
+
+
+def degradeNumpy(fileIn, outputFile, chain, rs, resources, samplerate='auto', log=None):
+    import audioengine
+
+    if log is None:
+        log = StepLog(enabled=False)
+
+    fileInRate = 16000
+    noisePack = resources.getNoisePack(fileInRate)
+    steps = list(zip(*getCodecs(chain)))
+    cache = resources.stageCache
+    rndidx0 = rs.rndidx
+    start, x = 0, None
+    if cache is not None:
+        # resume from the longest prefix of the chain already computed; only
+        # the prefixes shared by other degradations are stored, not the whole
+        # chain nor the prefixes after a random step (see stagecache.py)
+        keys = cache.prefixKeys(fileIn, fileInRate, steps, rndidx0, resources.fingerprint)
+        lastShared = min(cache.sharedSteps(steps), len(steps) - 1)
+        for k in range(lastShared, -1, -1):
+            hit = cache.get(keys[k])
+            if hit is not None:
+                x, draws = hit
+                rs.rndidx = (rndidx0 + draws) % len(rs.rnd)
+                start = k
+                print(f'resuming after {k} cached steps')
+                break
+    if x is None:
+        with log.step('decode'):
+            x, _ = audioengine.loadAudio(fileIn, fileInRate)
+        if cache is not None and lastShared >= 0:
+            cache.put(keys[0], x, 0)
+    for k, (codec, opts) in enumerate(steps[start:], start):
+        if cache is not None and start < k <= lastShared:
+            cache.put(keys[k], x, (rs.rndidx - rndidx0) % len(rs.rnd))
+        print(f'\napplying {codec}')
+        with log.step(codec, opts) as info:
+            if codec == 'noise':
+                if not resources.noiseFiles:
+                    print('no noise files available')
+                    continue
+                noiseFile = resources.noiseCatalog.choose(getFilter(opts), rs)
+                noiseStats = resources.noiseIndex.get(noiseFile)
+                lengthSecNoise = noiseStats.lengthSec
+                nSamplesSpeech, lengthSecSpeech, rmsAmpSpeech = audioengine.getAudioStats(x, fileInRate)
+                speechRMSAmp = audioengine.getSpeechRMSAmp(x, fileInRate)
+                snr = getSNR(opts)
+                posStart = rs.getRandom(int(max(0, lengthSecNoise - lengthSecSpeech) * fileInRate))
+                noise = getNoiseLoop(noiseFile, noisePack, fileInRate, posStart, nSamplesSpeech)
+                x, achieved = audioengine.mixNoiseSNR(x, noise, speechRMSAmp, snr)
+                print(f'SNR {achieved:.2f} dB (target {snr} dB)')
+                info['snr'] = achieved
+            elif codec == 'norm':
+                m = re.search(r'rms=([-+]?[0-9]+)', opts)
+                if m:
+                    x = audioengine.applyNorm(x, fileInRate, float(m.group(1)))
+            elif codec == 'bp':
+                m = re.search(r'cutoff=([0-9]+)-([0-9]+)', opts)
+                if m:
+                    x = audioengine.applyBandpass(x, fileInRate, int(m.group(1)), int(m.group(2)))
+            elif codec in maskFilters:
+                x = audioengine.applyFilter(x, fileInRate, codec)
+            elif codec in ('irdevice', 'irspace'):
+                irName = chooseIR(codec, opts, rs, resources)
+                if irName is None:
+                    print(f'no {codec} impulse responses available')
+                    continue
+                x = audioengine.applyIR(x, fileInRate, resources.getIRStore(), irName, getWet(opts))
+            elif codecbackend.available(codec):
+                x = codecbackend.encodeDecode(x, fileInRate, codec, opts)
+            else:
+                print(f'codec {codec} not available, skipping')
+
+    samplerate = fileInRate if samplerate == 'auto' else int(samplerate)
+    with log.step('write'):
+        audioengine.saveAudio(outputFile, audioengine.resample(x, fileInRate, samplerate), samplerate)
+
+
+def degradeStream(fileIn, outputFile, chain, rs, resources, samplerate='auto', log=None):
+    # block-wise processing with bounded memory. Steps that depend on the
+    # level of the signal (norm, noise) measure it in an extra pass over the
+    # input through the steps before them, unless it is known from 'norm'.
+    import audioengine
+    import audiostream
+
+    for codec in getCodecs(chain)[0]:
+        if codecbackend.available(codec) and not codecbackend.streamable(codec):
+            print(f'codec {codec} needs the whole signal, processing {fileIn} with the numpy backend')
+            return degradeNumpy(fileIn, outputFile, chain, rs, resources, samplerate, log)
+
+    if log is None:
+        log = StepLog(enabled=False)
+    fileInRate = 16000
+    noisePack = resources.getNoisePack(fileInRate)
+    stages = []
+    # (nSamples, speech RMS amplitude) of the output of the stages so far
+    level = None
+
+    def signal():
+        rate, blocks = audiostream.readBlocks(fileIn)
+        return audiostream.runStages(blocks, [audiostream.ResamplerStage(rate, fileInRate)] + [st() for st in stages])
+
+    def measure():
+        if level is not None:
+            return level
+        with log.step('measure'):
+            meter = audioengine.SpeechLevelMeter(fileInRate)
+            for x in signal():
+                meter.process(x)
+        return meter.nSamples, meter.result()
+
+    for codec, opts in zip(*getCodecs(chain)):
+        print(f'\napplying {codec}')
+        with log.step(codec, opts):
+            if codec == 'noise':
+                if not resources.noiseFiles:
+                    print('no noise files available')
+                    continue
+                noiseFile = resources.noiseCatalog.choose(getFilter(opts), rs)
+                noiseStats = resources.noiseIndex.get(noiseFile)
+                lengthSecNoise = noiseStats.lengthSec
+                nSamplesSpeech, speechRMSAmp = measure()
+                lengthSecSpeech = nSamplesSpeech / fileInRate
+                snr = getSNR(opts)
+                posStart = rs.getRandom(int(max(0, lengthSecNoise - lengthSecSpeech) * fileInRate))
+                posEnd = posStart + nSamplesSpeech
+                nSamplesNoise = -(-noiseStats.nSamples * fileInRate // noiseStats.rate)
+                if (noisePack is not None and noiseFile in noisePack) or posEnd > nSamplesNoise:
+                    # a noise to be looped is shorter than the input, it is read whole
+                    openNoise = lambda f=noiseFile, a=posStart, n=nSamplesSpeech: getNoiseLoop(f, noisePack, fileInRate, a, n)
+                else:
+                    openNoise = lambda f=noiseFile, a=posStart, b=posEnd: audiostream.noiseFileBlocks(f, a, b, fileInRate)
+                # the noise is scaled against the RMS of the part actually added
+                noiseRMSAmp = audiostream.noiseRMS(openNoise(), nSamplesSpeech)
+                noiseScaling = speechRMSAmp / noiseRMSAmp / (10**(snr/20)) if noiseRMSAmp > 0 else 0.0
+                stages.append(lambda o=openNoise, g=noiseScaling: audiostream.NoiseStage(o(), g))
+            elif codec == 'norm':
+                m = re.search(r'rms=([-+]?[0-9]+)', opts)
+                if m:
+                    nSamples, speechRMSAmp = measure()
+                    gain = 10**(float(m.group(1)) / 20) / speechRMSAmp
+                    stages.append(lambda g=gain: audiostream.GainStage(g))
+                    level = (nSamples, 10**(float(m.group(1)) / 20))
+                    continue
+            elif codec == 'bp':
+                m = re.search(r'cutoff=([0-9]+)-([0-9]+)', opts)
+                if m:
+                    H, nfft, numtaps = filterBank.getSpectrum('bp', fileInRate, (int(m.group(1)), int(m.group(2))))
+                    stages.append(lambda H=H, nfft=nfft, L=numtaps: audiostream.ConvolverStage(H, nfft, L, delay=L // 2))
+            elif codec in maskFilters:
+                H, nfft, numtaps = filterBank.getSpectrum(codec, fileInRate)
+                stages.append(lambda H=H, nfft=nfft, L=numtaps: audiostream.ConvolverStage(H, nfft, L, delay=L // 2))
+            elif codec in ('irdevice', 'irspace'):
+                irName = chooseIR(codec, opts, rs, resources)
+                if irName is None:
+                    print(f'no {codec} impulse responses available')
+                    continue
+                H, nfft, irLen = resources.getIRStore().getSpectrum(irName, fileInRate)
+                H = audioengine.wetSpectrum(H, getWet(opts))
+                stages.append(lambda H=H, nfft=nfft, irLen=irLen: audiostream.ConvolverStage(H, nfft, irLen))
+            elif codecbackend.available(codec):
+                stages.append(lambda c=codec, o=opts: audiostream.CodecStage(c, fileInRate, o))
+            else:
+                print(f'codec {codec} not available, skipping')
+                continue
+            level = None
+
+    samplerate = fileInRate if samplerate == 'auto' else int(samplerate)
+    # the steps only set up the stages, the signal is processed here
+    with log.step('render'):
+        writer = audiostream.AudioWriter(outputFile, samplerate)
+        try:
+            for x in audiostream.runStages(signal(), [audiostream.ResamplerStage(fileInRate, samplerate)]):
+                writer.write(x)
+        finally:
+            writer.close()
+
+
+def degrade(inputFile, outputFile, chain, seed='', resources=None, samplerate='auto', backend='numpy', debug=False, log=None):
+    # log: optional steplog.StepLog receiving a record per step
+    if resources is None:
+        resources = Resources()
+    rs = SafeRandom(resources.rnd, seed)
+    if backend == 'sox':
+        degradeSox(inputFile, outputFile, chain, rs, resources, samplerate, debug, log)
+    elif backend == 'stream':
+        degradeStream(inputFile, outputFile, chain, rs, resources, samplerate, log)
+    else:
+        degradeNumpy(inputFile, outputFile, chain, rs, resources, samplerate, log)
+    resources.save()
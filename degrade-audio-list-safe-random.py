@@ -24,31 +24,30 @@ import sys
 import os
 import re
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 import signal
 
+from degradation import Resources, degrade, degradationVersion, readList, resourceStamps
+from filterbank import filterVersion
+from irbank import bankFiles
+from resultcache import ResultCache, fingerprintFiles
+from saferandom import SafeRandom, loadTable
+from stagecache import StageCache
+from steplog import StepLog, printSummary, readLog
 
-def initRandom(file, seed):
-    global rnd, rndidx
-    rndidx = 0
-    rnd = []
-    with open(file, 'r', encoding='utf-8') as f:
-        rnd = [l.strip() for l in f.readlines()]
 
-    rndidx = 0 if seed in ('', '0') else int(seed) % len(rnd)
-    return rnd
+def initRandom(file, seed):
+    global rs
+    rs = SafeRandom(loadTable(file), seed)
+    return rs
 
 
 def getRandom(nvalues):
-    global rnd, rndidx
-    maxint = 9223372036854775807
-    out = int(float(nvalues) * float(rnd[rndidx]) / float(maxint))
-    rndidx = (rndidx + 1) % len(rnd)
-    return out
+    return rs.getRandom(nvalues)
 
 
 def listShuffle(l):
-    global rnd, rndidx
     idx = list(range(len(l)))
     for i in range(len(l)):
         ri1 = getRandom(len(l))
@@ -57,7 +56,7 @@ def listShuffle(l):
 
 
 def randomChoice(l):
-    return l[getRandom(len(l))]
+    return rs.randomChoice(l)
 
 
 def sigint_handler(signum, frame):
@@ -84,124 +83,255 @@ def fileEmpty(fileName):
     return not os.path.exists(fileName) or os.path.getsize(fileName) <= 2
 
 
-parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
-parser.add_argument("-s", dest="seed", default='0', help="Seed to initialize the random number generator")
-parser.add_argument('condition', nargs='?', help="Acoustic condition ([nocodec|landline|cellular|satellite|voip|interview|playback].[clean|noisy08|noisy15]")
-parser.add_argument("-D", dest="deviceirlist", default='ir-device-file-list.txt', help="Device impulse response file list")
-parser.add_argument("-P", dest="spaceirlist", default='ir-space-file-list.txt', help="Space impulse response file list")
-parser.add_argument("-N", dest="noiselist", default='noise-file-list.txt', help="Noise file list")
-parser.add_argument('filelist', nargs='?', help="File list to process")
-parser.add_argument('outdir', nargs='?')
-options = parser.parse_args()
-
-initRandom('random', options.seed)
-
-argcond = 'all' if options.condition == '-' else options.condition
-fileList = options.filelist
-outDir = options.outdir
-
-cmdFile = f'./degrade-audio-safe-random.py -D {options.deviceirlist} -P {options.spaceirlist} -N {options.noiselist}'
-signal.signal(signal.SIGINT, partial(sigint_handler))
-
-try:
-    with open(fileList, encoding='utf-8') as f:
-        files = [line.strip() for line in f]
-except Exception as e:
-    print(f'could not read file {fileList}: {e}')
-    sys.exit(1)
-
-cond, ncond, ncondsnr = '', '', ''
-s = argcond.split('.')
-if len(s) > 0:
-    cond = s[0]
-if len(s) > 1:
-    if s[1] in ('clean', ''):
-        ncond = ''
-    elif s[1] in ('noisy08', 'noisy15', 'noisy25'):
-        ncond, ncondsnr = s[1][:-2], s[1][-2:]
+workerResources = None
+workerLog = None
+
+allConditions = ['landline', 'cellular', 'satellite', 'voip', 'interview', 'playback']
+
+
+def initWorker(resourceArgs, stageCacheArgs=None, logFile=None):
+    # lists, random table and noise index are loaded once per worker
+    global workerResources, workerLog
+    workerLog = logFile
+    stageCache = StageCache(**stageCacheArgs) if stageCacheArgs is not None else None
+    workerResources = Resources(**resourceArgs, stageCache=stageCache)
+
+
+def runDegradations(group):
+    return [runDegradation(job) for job in group]
+
+
+def runDegradation(job):
+    fileIn, outputFile, chain, seed = job
+    print(f'degrading {fileIn} -> {outputFile} ({chain}, seed {seed})')
+    log = StepLog(enabled=bool(workerLog), input=fileIn, output=outputFile, chain=chain, condition=os.path.basename(os.path.dirname(outputFile)))
+    try:
+        degrade(fileIn, outputFile, chain, seed, workerResources, samplerate=8000, log=log)
+    except Exception as e:
+        print(f'could not degrade {fileIn}: {e}')
+        return False
+    finally:
+        if workerLog:
+            log.write(workerLog)
+    print('\n')
+    return True
+
+
+def conditionJobs(argcond):
+    # every condition starts from the seed, so its files, choices and .scp list
+    # are the same whether it is run alone or as part of 'all'
+    initRandom('random', options.seed)
+
+    cond, ncond, ncondsnr = '', '', ''
+    s = argcond.split('.')
+    if len(s) > 0:
+        cond = s[0]
+    if len(s) > 1:
+        if s[1] in ('clean', ''):
+            ncond = ''
+        elif s[1] in ('noisy08', 'noisy15', 'noisy25'):
+            ncond, ncondsnr = s[1][:-2], s[1][-2:]
+        else:
+            print('the noisy condition should be either noisy08 or noisy15')
+            sys.exit(0)
+
+    outDirCond = os.path.join(outDir, cond if ncond == '' else f'{cond}.{ncond}{ncondsnr}')
+    os.makedirs(outDirCond, exist_ok=True)
+
+    print(f'doing condition {cond}{"." + ncond if ncond else ""} (no noise condition)' if ncond == '' else f'doing condition {cond}.{ncond}')
+
+    with open(f'{outDirCond}.scp', 'w', encoding='utf-8') as fscp:
+        noiseConditions = ['clean', 'ambience-babble', 'ambience-private', 'ambience-music', 'ambience-nature', 'ambience-transportation', 'ambience-outdoors', 'ambience-public', 'ambience-impulsive']
+        codecConditions = ['nocodec', 'landline', 'cellular', 'satellite', 'voip', 'interview', 'playback']
+        levels = [-26, -29, -32, -35]
+        noiseTypes = ['ambience-babble', 'ambience-private', 'ambience-music', 'ambience-transportation', 'ambience-outdoors', 'ambience-public', 'ambience-impulsive']
+
+        codecsLandline = ['g711', 'g726']
+        codecsCellular = ['amr', 'amrwb', 'gsmfr']
+        codecsSatellite = ['g728', 'c2', 'cvsd']
+        codecsVoIP = ['silk', 'silkwb', 'g729a', 'g722']
+        codecsInterview = ['mp3', 'aac']
+        codecsPlayback = ['mp3', 'aac']
+        codecsBPFilter = ['g711', 'g726', 'amr', 'gsmfr', 'g728']
+
+        amrParms = ['amr[mode=0]', 'amr[mode=1]', 'amr[mode=2]', 'amr[mode=3]', 'amr[mode=4]', 'amr[mode=5]', 'amr[mode=6]', 'amr[mode=7]']
+        amrwbParms = ['amrwb[mode=0]', 'amrwb[mode=1]', 'amrwb[mode=2]', 'amrwb[mode=3]', 'amrwb[mode=4]', 'amrwb[mode=5]', 'amrwb[mode=6]', 'amrwb[mode=7]', 'amrwb[mode=8]']
+        g711Parms = ['g711[law=u]', 'g711[law=a]']
+        g726Parms = ['g726[bitrate=16]', 'g726[bitrate=24]', 'g726[bitrate=32]', 'g726[bitrate=40]']
+        g729aParms = ['g729a']
+        g722Parms = ['g722']
+        g728Parms = ['g728']
+        c2Parms = ['c2']
+        cvsdParms = ['cvsd']
+        silkParms = ['silk[bitrate=5]', 'silk[bitrate=10]', 'silk[bitrate=15]', 'silk[bitrate=20]']
+        silkwbParms = ['silkwb[bitrate=10]', 'silkwb[bitrate=20]', 'silkwb[bitrate=30]', 'silkwb[bitrate=40]']
+        gsmfrParms = ['gsmfr']
+        mp3Parms = ['mp3[bitrate=8]', 'mp3[bitrate=16]', 'mp3[bitrate=24]', 'mp3[bitrate=32]', 'mp3[bitrate=40]', 'mp3[bitrate=48]', 'mp3[bitrate=56]', 'mp3[bitrate=64]']
+        aacParms = ['aac[bitrate=8]', 'aac[bitrate=16]', 'aac[bitrate=24]', 'aac[bitrate=32]', 'aac[bitrate=40]', 'aac[bitrate=48]', 'aac[bitrate=56]', 'aac[bitrate=64]']
+        bpParms = ['bp[cutoff=300-3400]', 'bp[cutoff=200-3600]', 'bp[cutoff=100-3800]']
+
+        jobs = []
+        cacheKeys = []
+        nCached = 0
+        for nf, f in enumerate(files):
+            level = randomChoice(levels)
+            codecList = [f'norm[rms={level}]']
+
+            if ncond:
+                opt = f'noise[filter=ambience-public|ambience-private|ambience-outdoors|ambience-babble|ambience-transportation|ambience-music,snr={ncondsnr}]'
+                codecList.append(opt)
+
+            codecList2 = []
+            if cond == 'landline':
+                codec = randomChoice(codecsLandline)
+                if codec in codecsBPFilter:
+                    codecList2.append(randomChoice(bpParms))
+                codecList2.append(randomChoice(eval(f'{codec}Parms')))
+            elif cond == 'cellular':
+                codec = randomChoice(codecsCellular)
+                if codec in codecsBPFilter:
+                    codecList2.append(randomChoice(bpParms))
+                codecList2.append(randomChoice(eval(f'{codec}Parms')))
+            elif cond == 'satellite':
+                codec = randomChoice(codecsSatellite)
+                if codec in codecsBPFilter:
+                    codecList2.append(randomChoice(bpParms))
+                codecList2.append(randomChoice(eval(f'{codec}Parms')))
+            elif cond == 'voip':
+                codec = randomChoice(codecsVoIP)
+                codecList2.append(randomChoice(eval(f'{codec}Parms')))
+            elif cond == 'playback':
+                codec = randomChoice(codecsPlayback)
+                codecList2.append(randomChoice(eval(f'{codec}Parms')))
+            elif cond == 'interview':
+                codec = randomChoice(codecsInterview)
+                codecList2.append(randomChoice(eval(f'{codec}Parms')))
+            elif cond == 'nocodec':
+                pass
+
+            codecs = codecList + codecList2
+            outputFile = os.path.join(outDirCond, buildFileName(os.path.basename(f), codecs))
+            outputFile = os.path.splitext(outputFile)[0] + '.wav'
+
+            # all random choices, including the seed of each degradation, are drawn
+            # here in list order, so outputs do not depend on the number of jobs
+            if fileEmpty(outputFile):
+                job = (f, outputFile, ':'.join(codecs), str(rs.rndidx) if options.seed else '')
+                key = cache.key(f, job[2], job[3], 8000, 'numpy', resourcesFingerprint) if cache else None
+                if cache and cache.fetch(key, outputFile):
+                    nCached += 1
+                else:
+                    jobs.append(job)
+                    cacheKeys.append(key)
+            fscp.write(f'{outputFile}\n')
+            fscp.flush()
+    return jobs, cacheKeys, nCached
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("-s", dest="seed", default='0', help="Seed to initialize the random number generator")
+    parser.add_argument('condition', nargs='?', help="Acoustic condition ([nocodec|landline|cellular|satellite|voip|interview|playback].[clean|noisy08|noisy15]\n"
+                        "or 'all' for all of landline, cellular, satellite, voip, interview and playback, clean and noisy, in one pass")
+    parser.add_argument("-D", dest="deviceirlist", default='ir-device-file-list.txt', help="Device impulse response file list")
+    parser.add_argument("-P", dest="spaceirlist", default='ir-space-file-list.txt', help="Space impulse response file list")
+    parser.add_argument("-B", dest="irbank", default='impulse-responses/ir-bank', help="Prefix of the packed impulse response banks (built by prepare-impulse-responses.py)")
+    parser.add_argument("-N", dest="noiselist", default='noise-file-list.txt', help="Noise file list")
+    parser.add_argument("-I", dest="noiseindex", default='noise-stats.txt', help="Noise statistics index")
+    parser.add_argument("-K", dest="noisepack", default='noise-pack', help="Prefix of the packed noise corpus")
+    parser.add_argument("-j", dest="jobs", type=int, default=1, help="Number of files degraded concurrently")
+    parser.add_argument("-C", dest="cachedir", default=None, help="Directory of the result cache (no cache by default)")
+    parser.add_argument("-L", dest="cachesize", type=float, default=10240, help="Size limit of the result cache in MB (the -T directory has its own, -S)")
+    parser.add_argument("-T", dest="stagecachedir", default=None, help="Directory of the cache of intermediate buffers, shared by conditions with a common chain prefix")
+    parser.add_argument("-S", dest="stagecachesize", type=float, default=10240, help="Size limit of the directory of the cache of intermediate buffers in MB\n(separate from the -L limit of the result cache)")
+    parser.add_argument("-M", dest="stagecachemem", type=float, default=512, help="Memory used by the cache of intermediate buffers of every job, in MB")
+    parser.add_argument("-l", dest="log", default=None, help="JSON-lines log of the time and resources used by every step,\nsummarized per condition and per step at the end")
+    parser.add_argument('filelist', nargs='?', help="File list to process")
+    parser.add_argument('outdir', nargs='?')
+    options = parser.parse_args()
+
+    initRandom('random', options.seed)
+
+    argcond = 'all' if options.condition in ('-', 'all') else options.condition
+    fileList = options.filelist
+    outDir = options.outdir
+
+    resourceArgs = dict(noiseList=options.noiselist, deviceIRList=options.deviceirlist, spaceIRList=options.spaceirlist,
+                        noiseIndex=options.noiseindex, noisePack=options.noisepack, irBank=options.irbank)
+    if options.log:
+        # the log covers this run only
+        open(options.log, 'w').close()
+
+    stageCacheArgs = None
+    if options.stagecachedir:
+        stageCacheArgs = dict(memBytes=int(options.stagecachemem * 2**20), cacheDir=options.stagecachedir,
+                              diskBytes=int(options.stagecachesize * 2**20))
+    signal.signal(signal.SIGINT, partial(sigint_handler))
+
+    cache = None
+    if options.cachedir:
+        cache = ResultCache(options.cachedir, int(options.cachesize * 2**20), version=f'{degradationVersion}.{filterVersion}')
+        # outputs also depend on the lists, the random table, the IR banks and (by
+        # size and modification time) the noise files and the noise packs
+        resourcesFingerprint = fingerprintFiles([options.noiselist, options.deviceirlist, options.spaceirlist, 'random',
+                                                 'noise-db.txt', 'noise-type-list.txt'] +
+                                                [f for rate in (8000, 16000) for f in bankFiles(options.irbank, rate)])
+        resourcesFingerprint += ':' + '|'.join(resourceStamps(readList(options.noiselist), options.noisepack, options.irbank))
+
+    try:
+        with open(fileList, encoding='utf-8') as f:
+            files = [line.strip() for line in f]
+    except Exception as e:
+        print(f'could not read file {fileList}: {e}')
+        sys.exit(1)
+
+    if argcond == 'all':
+        conditions = [f'{c}.{n}' for c in allConditions for n in ('clean', 'noisy08', 'noisy15')]
+        # each clean file is decoded once for all the conditions, the worker keeps
+        # it (and shared chain prefixes) in its intermediate buffer cache
+        if stageCacheArgs is None:
+            stageCacheArgs = dict(memBytes=int(options.stagecachemem * 2**20))
+    else:
+        conditions = [argcond]
+
+    jobs, cacheKeys, nCached = [], [], 0
+    for c in conditions:
+        condJobs, condKeys, condCached = conditionJobs(c)
+        jobs += condJobs
+        cacheKeys += condKeys
+        nCached += condCached
+
+    # the jobs of a clean file run one after the other in the same worker
+    groups = {}
+    for n, job in enumerate(jobs):
+        groups.setdefault(job[0], []).append(n)
+    groups = list(groups.values())
+
+    if options.jobs > 1:
+        with ProcessPoolExecutor(max_workers=options.jobs, initializer=initWorker, initargs=(resourceArgs, stageCacheArgs, options.log)) as executor:
+            groupRets = list(executor.map(runDegradations, [[jobs[n] for n in g] for g in groups]))
     else:
-        print('the noisy condition should be either noisy08 or noisy15')
-        sys.exit(0)
-
-outDirCond = os.path.join(outDir, cond if ncond == '' else f'{cond}.{ncond}{ncondsnr}')
-os.makedirs(outDirCond, exist_ok=True)
-
-print(f'doing condition {cond}{"." + ncond if ncond else ""} (no noise condition)' if ncond == '' else f'doing condition {cond}.{ncond}')
-
-with open(f'{outDirCond}.scp', 'w', encoding='utf-8') as fscp:
-    noiseConditions = ['clean', 'ambience-babble', 'ambience-private', 'ambience-music', 'ambience-nature', 'ambience-transportation', 'ambience-outdoors', 'ambience-public', 'ambience-impulsive']
-    codecConditions = ['nocodec', 'landline', 'cellular', 'satellite', 'voip', 'interview', 'playback']
-    levels = [-26, -29, -32, -35]
-    noiseTypes = ['ambience-babble', 'ambience-private', 'ambience-music', 'ambience-transportation', 'ambience-outdoors', 'ambience-public', 'ambience-impulsive']
-
-    codecsLandline = ['g711', 'g726']
-    codecsCellular = ['amr', 'amrwb', 'gsmfr']
-    codecsSatellite = ['g728', 'c2', 'cvsd']
-    codecsVoIP = ['silk', 'silkwb', 'g729a', 'g722']
-    codecsInterview = ['mp3', 'aac']
-    codecsPlayback = ['mp3', 'aac']
-    codecsBPFilter = ['g711', 'g726', 'amr', 'gsmfr', 'g728']
-
-    amrParms = ['amr[mode=0]', 'amr[mode=1]', 'amr[mode=2]', 'amr[mode=3]', 'amr[mode=4]', 'amr[mode=5]', 'amr[mode=6]', 'amr[mode=7]']
-    amrwbParms = ['amrwb[mode=0]', 'amrwb[mode=1]', 'amrwb[mode=2]', 'amrwb[mode=3]', 'amrwb[mode=4]', 'amrwb[mode=5]', 'amrwb[mode=6]', 'amrwb[mode=7]', 'amrwb[mode=8]']
-    g711Parms = ['g711[law=u]', 'g711[law=a]']
-    g726Parms = ['g726[bitrate=16]', 'g726[bitrate=24]', 'g726[bitrate=32]', 'g726[bitrate=40]']
-    g729aParms = ['g729a']
-    g722Parms = ['g722']
-    g728Parms = ['g728']
-    c2Parms = ['c2']
-    cvsdParms = ['cvsd']
-    silkParms = ['silk[bitrate=5]', 'silk[bitrate=10]', 'silk[bitrate=15]', 'silk[bitrate=20]']
-    silkwbParms = ['silkwb[bitrate=10]', 'silkwb[bitrate=20]', 'silkwb[bitrate=30]', 'silkwb[bitrate=40]']
-    gsmfrParms = ['gsmfr']
-    mp3Parms = ['mp3[bitrate=8]', 'mp3[bitrate=16]', 'mp3[bitrate=24]', 'mp3[bitrate=32]', 'mp3[bitrate=40]', 'mp3[bitrate=48]', 'mp3[bitrate=56]', 'mp3[bitrate=64]']
-    aacParms = ['aac[bitrate=8]', 'aac[bitrate=16]', 'aac[bitrate=24]', 'aac[bitrate=32]', 'aac[bitrate=40]', 'aac[bitrate=48]', 'aac[bitrate=56]', 'aac[bitrate=64]']
-    bpParms = ['bp[cutoff=300-3400]', 'bp[cutoff=200-3600]', 'bp[cutoff=100-3800]']
-
-    for nf, f in enumerate(files):
-        level = randomChoice(levels)
-        codecList = [f'norm[rms={level}]']
-
-        if ncond:
-            opt = f'noise[filter=ambience-public|ambience-private|ambience-outdoors|ambience-babble|ambience-transportation|ambience-music,snr={ncondsnr}]'
-            codecList.append(opt)
-
-        codecList2 = []
-        if cond == 'landline':
-            codec = randomChoice(codecsLandline)
-            if codec in codecsBPFilter:
-                codecList2.append(randomChoice(bpParms))
-            codecList2.append(randomChoice(eval(f'{codec}Parms')))
-        elif cond == 'cellular':
-            codec = randomChoice(codecsCellular)
-            if codec in codecsBPFilter:
-                codecList2.append(randomChoice(bpParms))
-            codecList2.append(randomChoice(eval(f'{codec}Parms')))
-        elif cond == 'satellite':
-            codec = randomChoice(codecsSatellite)
-            if codec in codecsBPFilter:
-                codecList2.append(randomChoice(bpParms))
-            codecList2.append(randomChoice(eval(f'{codec}Parms')))
-        elif cond == 'voip':
-            codec = randomChoice(codecsVoIP)
-            codecList2.append(randomChoice(eval(f'{codec}Parms')))
-        elif cond == 'playback':
-            codec = randomChoice(codecsPlayback)
-            codecList2.append(randomChoice(eval(f'{codec}Parms')))
-        elif cond == 'interview':
-            codec = randomChoice(codecsInterview)
-            codecList2.append(randomChoice(eval(f'{codec}Parms')))
-        elif cond == 'nocodec':
-            pass
-
-        codecs = codecList + codecList2
-        outputFile = os.path.join(outDirCond, buildFileName(os.path.basename(f), codecs))
-        outputFile = os.path.splitext(outputFile)[0] + '.wav'
-
-        if fileEmpty(outputFile):
-            cmd = f'{cmdFile} {"-s " + str(rndidx) if options.seed else ""} -r 8000 -c {":".join(codecs)} "{f}" "{outputFile}"'
-            print(cmd)
-            os.system(cmd)
-            print('\n')
-        fscp.write(f'{outputFile}\n')
-        fscp.flush()
\ No newline at end of file
+        initWorker(resourceArgs, stageCacheArgs, options.log)
+        groupRets = [runDegradations([jobs[n] for n in g]) for g in groups]
+    rets = [None] * len(jobs)
+    for g, groupRet in zip(groups, groupRets):
+        for n, ret in zip(g, groupRet):
+            rets[n] = ret
+
+    if cache:
+        for job, ret, key in zip(jobs, rets, cacheKeys):
+            if ret:
+                cache.store(key, job[1])
+        cache.evict()
+        cache.save()
+        print(f'{nCached} files served from the result cache')
+
+    if options.log and os.path.exists(options.log):
+        records = readLog(options.log)
+        for key in ('condition', 'step'):
+            print()
+            printSummary(records, key)
+
+    nFailed = sum(1 for ret in rets if not ret)
+    if nFailed:
+        print(f'{nFailed} of {len(jobs)} degradations failed')
@@ -27,12 +27,11 @@ def remove_accents(input_str):
     nkfd_form = unicodedata.normalize('NFKD', input_str)
     return "".join(c for c in nkfd_form if not unicodedata.combining(c))
 
-def download_sound(sound_info, client, out_dir, fnl, fntl, fout, fr, noisetypes):
+# metadata read for every sound (one batched search per 150 sounds)
+soundFields = 'id,name,username,duration,samplerate,bitrate,type,tags,description,previews'
+
+def download_sound(sound_info, s, client, out_dir, fnl, fntl, fout, fr, noisetypes):
     soundid, soundtag, soundlic = sound_info
-    g = glob.glob(os.path.join(out_dir, soundtag, f'{soundid}*.wav'))
-    if g:
-        print(f'skipping file {g[0]}')
-        return
 
     if soundtag not in noisetypes:
         with threading.Lock():
@@ -40,22 +39,8 @@ def download_sound(sound_info, client, out_dir, fnl, fntl, fout, fr, noisetypes)
             fntl.write(f'{soundtag}\n')
             fntl.flush()
 
-    try:
-        s = client.get_sound(soundid)
-        if not isinstance(s, freesound.Sound):
-            print(f"Error: Sound ID {soundid} returned unexpected type {type(s)}, skipping")
-            return
-    except freesound.FreesoundException as e:
-        if e.code == 400:
-            print(f"Error: Invalid sound ID {soundid} (HTTP 400), skipping")
-        elif e.code == 429:
-            print('Maximum limit of requests to Freesound reached (2000/day)')
-            sys.exit(1)
-        else:
-            print(f"Error: FreesoundException for sound ID {soundid}: {e}, skipping")
-        return
-    except Exception as e:
-        print(f"Unexpected error for sound ID {soundid}: {e}, skipping")
+    if s is None:
+        print(f"Error: Sound ID {soundid} not found, skipping")
         return
 
     if hasattr(s, 'description') and s.description:
@@ -86,9 +71,14 @@ def download_sound(sound_info, client, out_dir, fnl, fntl, fout, fr, noisetypes)
     if downloadAudio:
         print(f'downloading sound {soundid}, noise type {soundtag}, {sdur} s')
         # 检查是否需要断点续传
-        if os.path.exists(ogg_path) and os.path.getsize(ogg_path) > 0:
-            print(f"  resuming download for {ogg_path}")
-        s.retrieve_preview_hq_ogg(out_dir_file, ogg)
+        # (retrieve renames the .part file once complete, so an existing
+        # ogg_path is a complete download)
+        if os.path.isfile(ogg_path):
+            print(f"  {ogg_path} already downloaded")
+        else:
+            if os.path.isfile(ogg_path + '.part'):
+                print(f"  resuming download for {ogg_path} at byte {os.path.getsize(ogg_path + '.part')}")
+            s.retrieve_preview_hq_ogg(out_dir_file, ogg)
 
         if os.path.isfile(ogg_path):
             str_src_file_info = f'{s.type}-{ssrate}kHz'
@@ -128,10 +118,13 @@ def download_sound(sound_info, client, out_dir, fnl, fntl, fout, fr, noisetypes)
 def worker(q, client, out_dir, fnl, fntl, fout, fr, noisetypes):
     while True:
         try:
-            sound_info = q.get_nowait()
+            sound_info, s = q.get_nowait()
         except queue.Empty:
             break
-        download_sound(sound_info, client, out_dir, fnl, fntl, fout, fr, noisetypes)
+        try:
+            download_sound(sound_info, s, client, out_dir, fnl, fntl, fout, fr, noisetypes)
+        except Exception as e:
+            print(f"Unexpected error for sound ID {sound_info[0]}: {e}, skipping")
         q.task_done()
 
 if len(sys.argv) != 2:
@@ -167,10 +160,29 @@ with files_to_open[0] as f, \
         fr.write('noise-type sound-id username name duration src-audio-quality tgt-audio-quality tags\n')
 
     noisetypes = []
-    sound_queue = queue.Queue()
+    sound_infos = []
     for line in f:
-        line = line.strip()
-        sound_queue.put(line.split(' '))
+        sound_info = line.strip().split(' ')
+        if len(sound_info) < 3:
+            continue
+        g = glob.glob(os.path.join(out_dir, sound_info[1], f'{sound_info[0]}*.wav'))
+        if g:
+            print(f'skipping file {g[0]}')
+            continue
+        sound_infos.append(sound_info)
+
+    try:
+        sounds = c.get_sounds([i[0] for i in sound_infos], fields=soundFields)
+    except freesound.FreesoundException as e:
+        if e.code == 429:
+            print('Maximum limit of requests to Freesound reached (2000/day)')
+        else:
+            print(f"Error: FreesoundException while reading the sound metadata: {e}")
+        sys.exit(1)
+
+    sound_queue = queue.Queue()
+    for sound_info in sound_infos:
+        sound_queue.put((sound_info, sounds.get(sound_info[0])))
 
     threads = []
     for _ in range(min(MAX_THREADS, sound_queue.qsize())):
@@ -0,0 +1,124 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Linear-phase FIR filters of the chain: 'bp' band-pass filters and the
+# telephony masks G.712 (300-3400 Hz channel), P.341 (50-7000 Hz wideband
+# send), IRS (P.48 intermediate reference system, send) and modified IRS
+# (P.830). The IRS and MIRS masks are approximated by piecewise linear
+# magnitude responses in dB. Every filter is designed once per sample rate;
+# its taps are cached in memory and in cacheDir (<name>-<rate>-v<version>.npy)
+# and its spectrum for FFT overlap-add is cached in memory.
+
+import os
+
+import numpy as np
+
+# increase when a design changes, so cached taps are not reused
+filterVersion = 1
+
+defaultCacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'filter-cache')
+
+# band edges (Hz) of the band-pass masks
+bands = {
+    'g712': (300, 3400),
+    'p341': (50, 7000),
+}
+
+# (Hz, dB) points of the magnitude responses; the response keeps the value of
+# the last point up to the Nyquist frequency
+responses = {
+    'irs': [(0, -60), (100, -40), (200, -20), (300, -8), (500, -4), (1000, 0), (2000, 3),
+            (3000, 5), (3400, 0), (3600, -20), (4000, -60)],
+    'mirs': [(0, -60), (100, -40), (200, -15), (300, -3), (500, -1), (1000, 0), (2000, 1),
+             (3000, 2), (3400, 0), (3600, -15), (4000, -60)],
+}
+
+filterNames = ['bp'] + list(bands) + list(responses)
+
+
+def numTaps(rate):
+    # 32 ms, odd
+    return 2 * int(round(0.032 * rate)) + 1
+
+
+def designFilter(name, rate, cutoff=None, numtaps=None):
+    from scipy.signal import firwin, firwin2
+
+    if name == 'bp':
+        lo, hi = cutoff
+        return firwin(numtaps or 513, [lo, min(hi, 0.975 * rate / 2)], window=('kaiser', 8.6),
+                      pass_zero=False, fs=rate).astype(np.float32)
+    numtaps = numtaps or numTaps(rate)
+    if name in bands:
+        lo, hi = bands[name]
+        return firwin(numtaps, [lo, min(hi, 0.975 * rate / 2)], window=('kaiser', 8.6),
+                      pass_zero=False, fs=rate).astype(np.float32)
+    points = [(f, db) for f, db in responses[name] if f <= rate / 2]
+    if points[-1][0] < rate / 2:
+        points.append((rate / 2, points[-1][1]))
+    freqs = [f for f, _ in points]
+    gains = [10**(db / 20) for _, db in points]
+    return firwin2(numtaps, freqs, gains, window=('kaiser', 8.6), fs=rate).astype(np.float32)
+
+
+class FilterBank:
+    def __init__(self, cacheDir=defaultCacheDir):
+        self.cacheDir = cacheDir
+        self.taps = {}
+        self.spectra = {}
+
+    def cacheFile(self, name, rate, cutoff):
+        tag = name if cutoff is None else f'{name}{cutoff[0]}-{cutoff[1]}'
+        return os.path.join(self.cacheDir, f'{tag}-{rate}-v{filterVersion}.npy')
+
+    def getTaps(self, name, rate, cutoff=None):
+        key = (name, rate, cutoff)
+        if key not in self.taps:
+            cacheFile = self.cacheFile(name, rate, cutoff) if self.cacheDir else None
+            if cacheFile and os.path.exists(cacheFile):
+                h = np.load(cacheFile)
+            else:
+                h = designFilter(name, rate, cutoff)
+                if cacheFile:
+                    try:
+                        os.makedirs(self.cacheDir, exist_ok=True)
+                        tmp = f'{cacheFile}.{os.getpid()}.tmp.npy'
+                        np.save(tmp, h)
+                        os.replace(tmp, cacheFile)
+                    except OSError:
+                        pass
+            self.taps[key] = h
+        return self.taps[key]
+
+    def getSpectrum(self, name, rate, cutoff=None):
+        # (H, nfft, number of taps) as audioengine.IRStore.getSpectrum
+        # audioengine imports this module
+        from audioengine import nextPow2
+
+        key = (name, rate, cutoff)
+        if key not in self.spectra:
+            h = self.getTaps(name, rate, cutoff)
+            nfft = max(4096, nextPow2(2 * len(h)))
+            self.spectra[key] = (np.fft.rfft(h, nfft), nfft, len(h))
+        return self.spectra[key]
+
+
+filterBank = FilterBank()
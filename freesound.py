@@ -22,14 +22,17 @@
 import os
 import re
 import json
-from urllib.request import urlopen, Request
-from urllib.parse import urlencode, quote
-from urllib.error import HTTPError
+import hashlib
+import threading
+import http.client
+from urllib.parse import urlencode, quote, urljoin, urlsplit
 
 
 class URIS:
     HOST = 'www.freesound.org'
-    BASE = 'https://' + HOST + '/apiv2'
+    # FREESOUND_BASE points the client to another server (e.g. a local
+    # stand-in for testing)
+    BASE = os.environ.get('FREESOUND_BASE', 'https://' + HOST + '/apiv2')
     TEXT_SEARCH = '/search/text/'
     CONTENT_SEARCH = '/search/content/'
     COMBINED_SEARCH = '/sounds/search/combined/'
@@ -62,6 +65,28 @@ class FreesoundClient:
         uri = URIS.uri(URIS.SOUND, sound_id)
         return FSRequest.request(uri, {}, self, Sound)
 
+    def get_sounds(self, sound_ids, fields=None, page_size=150):
+        # metadata of many sounds in a few requests: text searches filtered by
+        # 'id:(a OR b OR ...)', page_size ids per search (150 at most in
+        # apiv2), following the 'next' pages. Returns {str(id): Sound}; ids
+        # that are not found (or are not numbers) are left out
+        sound_ids = list(dict.fromkeys(str(i) for i in sound_ids if str(i).isdigit()))
+        sounds = {}
+        for k in range(0, len(sound_ids), page_size):
+            batch = sound_ids[k:k + page_size]
+            params = {'query': '', 'filter': f'id:({" OR ".join(batch)})', 'page_size': page_size}
+            if fields:
+                params['fields'] = fields if isinstance(fields, str) else ','.join(fields)
+            page = self.text_search(**params)
+            while True:
+                for r in page.results:
+                    s = Sound(r, self)
+                    sounds[str(s.id)] = s
+                if not getattr(page, 'next', None):
+                    break
+                page = page.next_page()
+        return sounds
+
     def text_search(self, **params):
         uri = URIS.uri(URIS.TEXT_SEARCH)
         return FSRequest.request(uri, params, self, Pager)
@@ -115,6 +140,79 @@ class FreesoundException(Exception):
         return f'<FreesoundException: code={self.code}, detail="{self.detail}">'
 
 
+class ConnectionPool:
+    # keep-alive HTTP(S) connections, shared by all threads: a request takes
+    # an idle connection to the host (or opens one) and gives it back once
+    # its response has been read, so threads reuse the connections (and TLS
+    # sessions) of each other instead of connecting for every request
+    def __init__(self, timeout=60, max_idle=32):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def connect(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                return conns.pop(), True
+        scheme, host, port = key
+        conn_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return conn_class(host, port, timeout=self.timeout), False
+
+    def release(self, response):
+        # after the body of 'response' has been read (or abandoned)
+        conn, key = response.pool_conn, response.pool_key
+        if response.will_close or not response.isclosed():
+            conn.close()
+            return
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def open(self, url, method='GET', body=None, headers=None, max_redirects=5):
+        # response of the request, after redirections; its body must be read
+        # and the response given back with release()
+        for _ in range(max_redirects + 1):
+            u = urlsplit(url)
+            key = (u.scheme, u.hostname, u.port)
+            path = (u.path or '/') + (f'?{u.query}' if u.query else '')
+            while True:
+                conn, reused = self.connect(key)
+                try:
+                    conn.request(method, path, body, headers or {})
+                    response = conn.getresponse()
+                    break
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    # the server closed an idle connection: try another one
+                    if not reused:
+                        raise
+            response.pool_conn, response.pool_key = conn, key
+            location = response.getheader('Location')
+            if response.status not in (301, 302, 303, 307, 308) or not location:
+                return response
+            response.read()
+            self.release(response)
+            url = urljoin(url, location)
+            if response.status == 303:
+                method, body = 'GET', None
+        raise FreesoundException(response.status, f'too many redirections ({url})')
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
+
+
+pool = ConnectionPool()
+
+
 class FSRequest:
     @classmethod
     def request(cls, uri, params=None, client=None, wrapper=FreesoundObject, method='GET', data=None):
@@ -122,30 +220,108 @@ class FSRequest:
         url = f'{uri}?{urlencode(p)}' if params else uri
         d = urlencode(data).encode('utf-8') if data else None
         headers = {'Authorization': client.header}
-        req = Request(url, data=d, headers=headers)
+        if d is not None:
+            method = 'POST' if method == 'GET' else method
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        response = pool.open(url, method, d, headers)
         try:
-            with urlopen(req) as f:
-                resp = f.read().decode('utf-8')
-        except HTTPError as e:
-            resp = e.read().decode('utf-8')
-            if 200 <= e.code < 300:
-                return resp
-            else:
-                raise FreesoundException(e.code, json.loads(resp))
+            resp = response.read().decode('utf-8')
+        finally:
+            pool.release(response)
+        if response.status >= 300:
+            try:
+                detail = json.loads(resp)
+            except ValueError:
+                detail = resp
+            raise FreesoundException(response.status, detail)
         result = json.loads(resp)
         if wrapper:
             return wrapper(result, client)
         return result
 
     @classmethod
-    def retrieve(cls, url, client, path):
+    def retrieve(cls, url, client, path, size=None, md5=None, chunk_size=1 << 16):
+        # streams the file to <path>.part in chunks of chunk_size bytes; a
+        # .part file left by an interrupted download is resumed with a Range
+        # request. Once complete, the size (the one announced by the server,
+        # or 'size') and the md5 digest (if given) are checked and the file is
+        # renamed to path, so path only ever holds complete files
         print(f'  from {url}', end='')
-        req = Request(url, headers={'Authorization': client.header})
-        with urlopen(req) as response, open(path, 'wb') as out_file:
-            out_file.write(response.read())
+        part = path + '.part'
+        for _ in range(2):
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = {'Authorization': client.header}
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+            response = pool.open(url, headers=headers)
+            try:
+                total = cls.content_total(response, offset)
+                if response.status == 416 and total == offset:
+                    # complete already
+                    response.read()
+                    break
+                if response.status == 416 or total is False:
+                    # the .part file does not match the file on the server
+                    response.read()
+                    os.remove(part)
+                    continue
+                if response.status >= 300:
+                    detail = response.read().decode('utf-8', 'replace')
+                    raise FreesoundException(response.status, detail)
+                if response.status == 200:
+                    # the whole file (range requests not supported)
+                    offset = 0
+                with open(part, 'ab' if offset else 'wb') as out_file:
+                    while True:
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        out_file.write(chunk)
+            finally:
+                pool.release(response)
+            break
+        else:
+            raise FreesoundException(416, f'cannot resume {part}')
+        received = os.path.getsize(part)
+        for expected in (total, size):
+            if expected is not None and received != expected:
+                # a short file is a dropped connection: kept to be resumed
+                if received > expected:
+                    os.remove(part)
+                raise FreesoundException(response.status, f'{url}: received {received} bytes instead of {expected}')
+        if md5 is not None and file_md5(part) != md5.lower():
+            os.remove(part)
+            raise FreesoundException(response.status, f'{url}: md5 mismatch')
+        os.replace(part, path)
         print()
         return path
 
+    @staticmethod
+    def content_total(response, offset):
+        # size of the whole file from the headers of the response to a
+        # request from byte offset: None if unknown, False if the response
+        # does not continue the partial file
+        length = response.getheader('Content-Length')
+        if response.status == 200:
+            return int(length) if length else None
+        if response.status == 206:
+            m = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', response.getheader('Content-Range', ''))
+            if not m or int(m.group(1)) != offset:
+                return False
+            return int(m.group(3)) if m.group(3) != '*' else None
+        if response.status == 416:
+            m = re.match(r'bytes \*/(\d+)', response.getheader('Content-Range', ''))
+            return int(m.group(1)) if m else None
+        return None
+
+
+def file_md5(path, chunk_size=1 << 20):
+    h = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
 
 class Pager(FreesoundObject):
     def __getitem__(self, key):
@@ -170,7 +346,7 @@ class Sound(FreesoundObject):
     def retrieve(self, directory, soundid, name=False):
         path = os.path.join(directory, name if name else self.name)
         uri = URIS.uri(URIS.DOWNLOAD, soundid)
-        return FSRequest.retrieve(uri, self.client, path)
+        return FSRequest.retrieve(uri, self.client, path, size=getattr(self, 'filesize', None))
 
     def retrieve_preview_hq_ogg(self, directory, name=False):
         path = os.path.join(directory, name if name else self.previews.preview_hq_ogg.split("/")[-1])
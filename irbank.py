@@ -0,0 +1,86 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Packed impulse response bank, one per sample rate: all IRs concatenated in
+# a float32 .npy file (<prefix>-<rate>.npy) plus an index (<prefix>-<rate>.idx,
+# one 'name<TAB>offset<TAB>length<TAB>category' line per IR). The .npy file is
+# memory mapped, so an IR is a slice of it.
+
+import os
+
+import numpy as np
+
+
+def bankFiles(prefix, rate):
+    return f'{prefix}-{rate}.npy', f'{prefix}-{rate}.idx'
+
+
+def writeBank(prefix, rate, entries):
+    # entries: list of (name, category, ir). Both files are written to
+    # temporary files and moved into place, the index last, so that an
+    # interrupted write leaves the previous bank
+    npyFile, idxFile = bankFiles(prefix, rate)
+    os.makedirs(os.path.dirname(npyFile) or '.', exist_ok=True)
+    irs = [np.asarray(ir, dtype=np.float32) for _, _, ir in entries]
+    data = np.concatenate(irs) if irs else np.zeros(0, dtype=np.float32)
+    npyTmp = f'{npyFile}.{os.getpid()}.tmp.npy'
+    idxTmp = f'{idxFile}.{os.getpid()}.tmp'
+    try:
+        np.save(npyTmp, data)
+        offset = 0
+        with open(idxTmp, 'w', encoding='utf-8') as f:
+            for (name, category, _), ir in zip(entries, irs):
+                f.write(f'{name}\t{offset}\t{len(ir)}\t{category}\n')
+                offset += len(ir)
+        os.replace(npyTmp, npyFile)
+        os.replace(idxTmp, idxFile)
+    finally:
+        for tmp in (npyTmp, idxTmp):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+class IRBank:
+    def __init__(self, prefix, rate):
+        npyFile, idxFile = bankFiles(prefix, rate)
+        self.rate = rate
+        self.table = {}
+        with open(idxFile, encoding='utf-8') as f:
+            for ln in f:
+                name, offset, length, category = ln.rstrip('\n').split('\t')
+                self.table[name] = (int(offset), int(length), category)
+        self.data = np.load(npyFile, mmap_mode='r') if self.table else np.zeros(0, dtype=np.float32)
+
+    @classmethod
+    def open(cls, prefix, rate):
+        if not all(os.path.exists(f) for f in bankFiles(prefix, rate)):
+            return None
+        return cls(prefix, rate)
+
+    def __contains__(self, name):
+        return name in self.table
+
+    def get(self, name):
+        offset, length, _ = self.table[name]
+        return self.data[offset:offset + length]
+
+    def names(self, category=None):
+        return [name for name, (_, _, cat) in self.table.items() if category is None or cat == category]
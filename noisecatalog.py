@@ -0,0 +1,100 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Noise files indexed by category, for the 'filter=' option of 'noise'. The
+# category of a file is the tag of its freesound id (leading number of the
+# file name) in noise-db.txt, or else the name of its directory if that is a
+# known category (download-noise-db.py stores files as <tag>/<id>-....wav).
+# The files are sorted by category (in the order of noise-type-list.txt), so
+# every category is a contiguous range of one index array and a filtered draw
+# takes one random number, whatever the size of the list.
+
+import os
+import re
+
+import numpy as np
+
+
+def readTags(noiseDb):
+    # freesound id -> category
+    tags = {}
+    if os.path.exists(noiseDb):
+        with open(noiseDb, encoding='utf-8') as f:
+            for ln in f:
+                s = ln.split()
+                if len(s) >= 2:
+                    tags[s[0]] = s[1]
+    return tags
+
+
+class NoiseCatalog:
+    def __init__(self, noiseFiles, noiseDb='noise-db.txt', noiseTypeList='noise-type-list.txt'):
+        self.noiseFiles = noiseFiles
+        tags = readTags(noiseDb)
+        categories = []
+        if os.path.exists(noiseTypeList):
+            with open(noiseTypeList, encoding='utf-8') as f:
+                categories = [ln.strip() for ln in f if ln.strip()]
+        for tag in tags.values():
+            if tag not in categories:
+                categories.append(tag)
+        known = set(categories)
+
+        fileCategories = []
+        for fileName in noiseFiles:
+            m = re.match(r'([0-9]+)', os.path.basename(fileName))
+            category = tags.get(m.group(1)) if m else None
+            if category is None:
+                category = os.path.basename(os.path.dirname(fileName))
+            fileCategories.append(category if category in known else '')
+
+        self.categories = categories
+        catIndex = {c: i for i, c in enumerate(categories)}
+        key = np.array([catIndex.get(c, len(categories)) for c in fileCategories], dtype=np.int64)
+        self.order = np.argsort(key, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(np.bincount(key, minlength=len(categories) + 1))])
+        self.ranges = {c: (int(starts[i]), int(starts[i + 1])) for i, c in enumerate(categories)}
+        self.filters = {}
+
+    def count(self, category):
+        a, b = self.ranges.get(category, (0, 0))
+        return b - a
+
+    def filterRanges(self, keywords):
+        # cumulative sizes and starts of the ranges of the categories in
+        # 'keywords', in catalogue order
+        key = tuple(sorted(set(keywords)))
+        if key not in self.filters:
+            ranges = [self.ranges[c] for c in self.categories if c in key and self.count(c)]
+            sizes = np.array([b - a for a, b in ranges], dtype=np.int64)
+            self.filters[key] = (np.cumsum(sizes), np.array([a for a, _ in ranges], dtype=np.int64))
+        return self.filters[key]
+
+    def choose(self, keywords, rs):
+        # one draw from the random stream, as rs.randomChoice()
+        if keywords:
+            ends, starts = self.filterRanges(keywords)
+            if len(ends):
+                k = rs.getRandom(int(ends[-1]))
+                i = int(np.searchsorted(ends, k, side='right'))
+                return self.noiseFiles[self.order[starts[i] + k - (ends[i - 1] if i else 0)]]
+            print(f'no noise files of category {"|".join(keywords)}, choosing among all noise files')
+        return rs.randomChoice(self.noiseFiles)
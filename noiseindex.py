@@ -0,0 +1,107 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Persistent statistics of the noise files, so that the 'noise' step does not
+# decode a whole noise recording to learn its length and level. Entries are
+# keyed by path and validated against the file size and mtime, stale or
+# missing entries are recomputed on lookup.
+
+import os
+import sys
+from collections import namedtuple
+
+indexVersion = 2
+indexHeader = f'# noise-stats v{indexVersion}'
+
+NoiseStats = namedtuple('NoiseStats', ['nSamples', 'rate', 'lengthSec', 'rmsAmp', 'speechRMSAmp'])
+
+
+def computeStats(fileName):
+    import audioengine
+
+    x, fs = audioengine.loadAudio(fileName)
+    nSamples, lengthSec, rmsAmp = audioengine.getAudioStats(x, fs)
+    return NoiseStats(nSamples, fs, lengthSec, rmsAmp, audioengine.getSpeechRMSAmp(x, fs))
+
+
+class NoiseIndex:
+    def __init__(self, indexFile):
+        self.indexFile = indexFile
+        self.entries = {}
+        self.dirty = False
+        if os.path.exists(indexFile):
+            self.load()
+
+    def load(self):
+        with open(self.indexFile, encoding='utf-8') as f:
+            if f.readline().strip() != indexHeader:
+                print(f'ignoring outdated noise index {self.indexFile}')
+                self.dirty = True
+                return
+            for ln in f:
+                s = ln.rstrip('\n').split('\t')
+                if len(s) != 8:
+                    continue
+                self.entries[s[0]] = ((int(s[1]), int(s[2])),
+                                      NoiseStats(int(s[3]), int(s[4]), float(s[5]), float(s[6]), float(s[7])))
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = f'{self.indexFile}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(f'{indexHeader}\n')
+            for path, ((size, mtime), st) in self.entries.items():
+                f.write(f'{path}\t{size}\t{mtime}\t{st.nSamples}\t{st.rate}\t{st.lengthSec!r}\t{st.rmsAmp!r}\t{st.speechRMSAmp!r}\n')
+        os.replace(tmp, self.indexFile)
+        self.dirty = False
+
+    def get(self, fileName):
+        st = os.stat(fileName)
+        key = (st.st_size, st.st_mtime_ns)
+        entry = self.entries.get(fileName)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        stats = computeStats(fileName)
+        self.entries[fileName] = (key, stats)
+        self.dirty = True
+        return stats
+
+    def update(self, fileNames):
+        for n, fileName in enumerate(fileNames):
+            self.get(fileName)
+            if (n + 1) % 100 == 0:
+                print(f'{n + 1}/{len(fileNames)} noise files indexed')
+        live = set(fileNames)
+        for path in [p for p in self.entries if p not in live]:
+            del self.entries[path]
+            self.dirty = True
+        self.save()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Syntax: noiseindex.py noise-file-list.txt noise-stats.txt')
+        sys.exit(0)
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        files = [line.strip() for line in f if line.strip()]
+    NoiseIndex(sys.argv[2]).update(files)
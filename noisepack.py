@@ -0,0 +1,122 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Noise corpus packed into one contiguous raw int16 file per sample rate
+# (<prefix>-<rate>.pcm) plus an offset table (<prefix>-<rate>.idx, one
+# 'path<TAB>offset<TAB>nSamples<TAB>size<TAB>mtime' line per noise file).
+# Segments are slices of a memory map, so reading one costs the same wherever
+# it starts. A pack whose noise files have changed since it was built (size or
+# modification time) is not used.
+
+import os
+import sys
+
+import numpy as np
+
+packRates = [8000, 16000]
+
+
+def packFiles(prefix, rate):
+    return f'{prefix}-{rate}.pcm', f'{prefix}-{rate}.idx'
+
+
+def fileStamp(fileName):
+    st = os.stat(fileName)
+    return f'{st.st_size}\t{st.st_mtime_ns}'
+
+
+def packNoise(fileNames, prefix, rates=packRates):
+    import audioengine
+
+    outs = {}
+    for rate in rates:
+        pcmFile, idxFile = packFiles(prefix, rate)
+        outs[rate] = (open(f'{pcmFile}.tmp', 'wb'), open(f'{idxFile}.tmp', 'w', encoding='utf-8'), [0])
+    try:
+        for n, fileName in enumerate(fileNames):
+            stamp = fileStamp(fileName)
+            x, fs = audioengine.loadAudio(fileName)
+            for rate, (fpcm, fidx, offset) in outs.items():
+                y = audioengine.clip(audioengine.resample(x, fs, rate))
+                y = np.round(y * 32768).astype('<i2')
+                fpcm.write(y.tobytes())
+                fidx.write(f'{fileName}\t{offset[0]}\t{len(y)}\t{stamp}\n')
+                offset[0] += len(y)
+            if (n + 1) % 100 == 0:
+                print(f'{n + 1}/{len(fileNames)} noise files packed')
+    finally:
+        for fpcm, fidx, _ in outs.values():
+            fpcm.close()
+            fidx.close()
+    for rate in rates:
+        for f in packFiles(prefix, rate):
+            os.replace(f'{f}.tmp', f)
+
+
+class NoisePack:
+    def __init__(self, prefix, rate):
+        pcmFile, idxFile = packFiles(prefix, rate)
+        self.rate = rate
+        self.table = {}
+        # stamps of the noise files when the pack was built
+        self.stamps = {}
+        with open(idxFile, encoding='utf-8') as f:
+            for ln in f:
+                path, offset, nSamples, *stamp = ln.rstrip('\n').split('\t')
+                self.table[path] = (int(offset), int(nSamples))
+                self.stamps[path] = '\t'.join(stamp)
+        self.data = np.memmap(pcmFile, dtype='<i2', mode='r') if os.path.getsize(pcmFile) else np.zeros(0, dtype='<i2')
+
+    @classmethod
+    def open(cls, prefix, rate):
+        if not all(os.path.exists(f) for f in packFiles(prefix, rate)):
+            return None
+        pack = cls(prefix, rate)
+        changed = pack.changedFile()
+        if changed is not None:
+            print(f'noise pack {prefix}-{rate} is out of date ({changed} has changed), not used; rebuild it with noisepack.py')
+            return None
+        return pack
+
+    def changedFile(self):
+        # the first noise file that differs from the one packed (packs written
+        # without stamps are out of date too)
+        for path, stamp in self.stamps.items():
+            if not os.path.exists(path) or fileStamp(path) != stamp:
+                return path
+        return None
+
+    def __contains__(self, fileName):
+        return fileName in self.table
+
+    def segment(self, fileName, start, stop):
+        offset, nSamples = self.table[fileName]
+        return self.data[offset + min(start, nSamples):offset + min(stop, nSamples)]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Syntax: noisepack.py noise-file-list.txt noise-pack')
+        sys.exit(0)
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        files = [line.strip() for line in f if line.strip()]
+    packNoise(files, sys.argv[2])
@@ -0,0 +1,210 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Runs external tools on in-memory data, without a shell and without
+# temporary files:
+#
+#   out = runPipeline([[cmd1, ...], [cmd2, ...]], data, files={'noise': noiseData})
+#
+# Commands are argument lists. Consecutive commands are linked by pipes
+# (stdout -> stdin), 'data' is the stdin of the first one and the stdout of
+# the last one is returned. Tools that need file names get memory files
+# (memfd, Linux) opened through /dev/fd (Linux, macOS), or named temporary
+# files where there is no /dev/fd:
+#   - '{in}' is the input of the command (the output of the previous one)
+#   - '{out}' is its output, instead of stdout (which is discarded, e.g. the
+#     banners of the STL tools)
+#   - '{name}' is the memory file holding files['name']
+#
+# PipeStream runs commands without memory files (stdin to stdout tools)
+# block by block, for the stream backend:
+#
+#   stream = PipeStream([[cmd1, ...], [cmd2, ...]])
+#   out = stream.write(data)   # output available so far
+#   out = stream.close()       # the rest, after the end of the input
+
+import os
+import subprocess
+import tempfile
+import threading
+
+
+class MemFile:
+    def __init__(self, data=b''):
+        self.f = self.name = None
+        if not os.path.isdir('/dev/fd'):
+            self.fd, self.name = tempfile.mkstemp(prefix='pipeline')
+        elif hasattr(os, 'memfd_create'):
+            self.fd = os.memfd_create('pipeline')
+        else:
+            self.f = tempfile.TemporaryFile()
+            self.fd = self.f.fileno()
+        with open(self.fd, 'wb', closefd=False) as f:
+            f.write(data)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        self.path = self.name or f'/dev/fd/{self.fd}'
+
+    def read(self):
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        with open(self.fd, 'rb', closefd=False) as f:
+            return f.read()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+        else:
+            os.close(self.fd)
+        if self.name is not None:
+            os.remove(self.name)
+
+
+def uses(cmd, placeholder):
+    return any(placeholder in a for a in cmd)
+
+
+def killAll(procs):
+    # stops the commands started so far when the pipeline cannot be completed
+    for p in procs:
+        p.kill()
+    for p in procs:
+        for f in (p.stdin, p.stdout):
+            if f is not None:
+                f.close()
+        p.wait()
+
+
+def runGroup(commands, data, files):
+    # commands linked by pipes, the first reading 'data' and the last writing
+    # to the returned bytes
+    src, dst = MemFile(data), MemFile()
+    try:
+        paths = {f'{{{name}}}': f.path for name, f in files.items()}
+        paths['{in}'], paths['{out}'] = src.path, dst.path
+        # the named temporary files are opened by name
+        fds = [f.fd for f in [src, dst] + list(files.values()) if f.name is None]
+        procs = []
+        stdin = src.fd
+        try:
+            for k, cmd in enumerate(commands):
+                args = []
+                for a in cmd:
+                    for key, path in paths.items():
+                        a = a.replace(key, path)
+                    args.append(a)
+                if k < len(commands) - 1:
+                    stdout = subprocess.PIPE
+                else:
+                    stdout = subprocess.DEVNULL if uses(cmd, '{out}') else dst.fd
+                p = subprocess.Popen(args, stdin=stdin, stdout=stdout, pass_fds=fds)
+                if procs:
+                    # the child holds the pipe now
+                    procs[-1].stdout.close()
+                procs.append(p)
+                stdin = p.stdout
+        except BaseException:
+            killAll(procs)
+            raise
+        for p in procs:
+            p.wait()
+        # from the last one: a failing command breaks the pipes of the ones
+        # before it
+        for p in reversed(procs):
+            if p.returncode:
+                raise subprocess.CalledProcessError(p.returncode, p.args)
+        return dst.read()
+    finally:
+        src.close()
+        dst.close()
+
+
+def runPipeline(commands, data=b'', files=None):
+    memFiles = {name: MemFile(content) for name, content in (files or {}).items()}
+    try:
+        i = 0
+        while i < len(commands):
+            # a command reading '{in}' needs all the output of the previous
+            # one, which is then written to a memory file instead of a pipe
+            j = i + 1
+            while j < len(commands) and not uses(commands[j - 1], '{out}') and not uses(commands[j], '{in}'):
+                j += 1
+            data = runGroup(commands[i:j], data, memFiles)
+            i = j
+        return data
+    finally:
+        for f in memFiles.values():
+            f.close()
+
+
+class PipeStream:
+    def __init__(self, commands):
+        self.procs = []
+        try:
+            stdin = subprocess.PIPE
+            for cmd in commands:
+                p = subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE)
+                if self.procs:
+                    self.procs[-1].stdout.close()
+                self.procs.append(p)
+                stdin = p.stdout
+        except BaseException:
+            killAll(self.procs)
+            raise
+        self.chunks = []
+        self.lock = threading.Lock()
+        # the output is read as it comes, so that writing never blocks on a
+        # full pipe
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        out = self.procs[-1].stdout
+        for data in iter(lambda: out.read1(1 << 16), b''):
+            with self.lock:
+                self.chunks.append(data)
+
+    def take(self):
+        with self.lock:
+            data = b''.join(self.chunks)
+            self.chunks = []
+        return data
+
+    def write(self, data):
+        try:
+            self.procs[0].stdin.write(data)
+            self.procs[0].stdin.flush()
+        except BrokenPipeError:
+            # a command has stopped: reported by close()
+            pass
+        return self.take()
+
+    def close(self):
+        try:
+            self.procs[0].stdin.close()
+        except BrokenPipeError:
+            pass
+        self.reader.join()
+        self.procs[-1].stdout.close()
+        for p in self.procs:
+            p.wait()
+        for p in reversed(self.procs):
+            if p.returncode:
+                raise subprocess.CalledProcessError(p.returncode, p.args)
+        return self.take()
@@ -19,11 +19,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import argparse
+import hashlib
 import os
-import subprocess
+import re
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import soundfile as sf  # 替换 scikits.audiolab
-import librosa  # 替换 scikits.samplerate
+
+from audioengine import resample
+from irbank import writeBank
 
 
 def loadSignal(fileName):
@@ -37,6 +42,9 @@ def loadSignal(fileName):
 
 irOriginal = 'impulse-responses-original'
 irOutput = 'impulse-responses'
+irBank = os.path.join(irOutput, 'ir-bank')
+irCache = os.path.join(irOutput, 'cache')
+irManifest = os.path.join(irOutput, 'manifest.txt')
 irDeviceList = 'ir-device-file-list.txt'
 irSpaceList = 'ir-space-file-list.txt'
 
@@ -44,77 +52,132 @@ kwDevice = ['devices']
 kwSpace = ['spaces']
 kwBlockSpace = []
 
-# 获取 WAV 文件列表（Windows 兼容）
-swav = subprocess.check_output(f'dir /s /b "{irOriginal}\\*.wav"', shell=True).decode('utf-8')
-swav = swav.splitlines()
-
-nDevice = 0
-nSpace = 0
-
-with open(irDeviceList, 'w', encoding='utf-8') as fdevice, \
-     open(irSpaceList, 'w', encoding='utf-8') as fspace:
-    for ln in swav:
-        ln = ln.strip()
-        if not ln:
-            continue
-
-        fileName, fileExtension = os.path.splitext(ln)
-        x, fs = loadSignal(ln)
-        if x is None:
-            continue
-
-        sx = x.shape
-        if len(sx) == 2:
-            ir = x[:, 1]  # 取右声道
-        elif len(sx) == 1:
-            ir = x
-        else:
-            print(f'too many channels for IR {ln}: skipping')
-            continue
-
-        # 重采样到 8kHz 和 16kHz 并归一化
-        ir8k = librosa.resample(ir, orig_sr=fs, target_sr=8000)
-        ir8kabs = ir8k * ir8k
-        sum8k = ir8kabs.sum()
-        ir8k = ir8k / np.sqrt(sum8k) if sum8k > 0 else ir8k
-
-        dname = os.path.dirname(ln)
-        lin = dname.split(os.sep)[1:]
-        lout = [''.join(c for c in elem if c.isalnum()) for elem in lin]
-        outdir = os.path.join(irOutput, *lout)
-
-        basename = os.path.basename(ln)
-        basename = re.sub(r'.wav', '', basename)
-        basename = ''.join(c for c in basename if c.isalnum())
-
-        basename8k = f'{basename}-8000.ir'
-        outfile8k = os.path.join(outdir, basename8k)
-
-        ir16k = librosa.resample(ir, orig_sr=fs, target_sr=16000)
-        ir16kabs = ir16k * ir16k
-        sum16k = ir16kabs.sum()
-        ir16k = ir16k / np.sqrt(sum16k) if sum16k > 0 else ir16k
-        basename16k = f'{basename}-16000.ir'
-        outfile16k = os.path.join(outdir, basename16k)
-
-        foundSpace = any(kw in dname for kw in kwSpace) and not any(kw in dname for kw in kwBlockSpace)
-        foundDevice = any(kw in dname for kw in kwDevice)
-
-        if foundDevice:
-            os.makedirs(outdir, exist_ok=True)
-            print(ln)
-            np.savetxt(outfile8k, ir8k, fmt='%f', delimiter=' ')
-            np.savetxt(outfile16k, ir16k, fmt='%f', delimiter=' ')
-            fdevice.write(f'{outfile16k}\n')
-            nDevice += 1
-
-        if foundSpace:
-            os.makedirs(outdir, exist_ok=True)
-            print(ln)
-            np.savetxt(outfile8k, ir8k, fmt='%f', delimiter=' ')
-            np.savetxt(outfile16k, ir16k, fmt='%f', delimiter=' ')
-            fspace.write(f'{outfile16k}\n')
-            nSpace += 1
-
-print(f'{nDevice} device IRs')
-print(f'{nSpace} space IRs')
\ No newline at end of file
+# bump when the processing changes, so that cached IRs are recomputed
+processingVersion = 'polyphase-16k-8k-v1'
+
+
+def findWavs(top):
+    swav = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames.sort()
+        swav.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith('.wav'))
+    return swav
+
+
+def fileHash(fileName):
+    h = hashlib.sha1(processingVersion.encode('utf-8'))
+    with open(fileName, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def normalize(ir):
+    sumsq = (ir * ir).sum()
+    return ir / np.sqrt(sumsq) if sumsq > 0 else ir
+
+
+def processIR(ln, cacheFile):
+    x, fs = loadSignal(ln)
+    if x is None:
+        return False
+
+    sx = x.shape
+    if len(sx) == 2:
+        ir = x[:, 1]  # 取右声道
+    elif len(sx) == 1:
+        ir = x
+    else:
+        print(f'too many channels for IR {ln}: skipping')
+        return False
+
+    # 重采样到 16kHz，再由 16kHz 得到 8kHz，两个采样率共用同一个多相滤波设计
+    ir16k = resample(ir.astype(np.float32), fs, 16000)
+    ir8k = resample(ir16k, 16000, 8000)
+    tmp = f'{cacheFile}.{os.getpid()}.tmp.npz'
+    np.savez(tmp, ir8k=normalize(ir8k), ir16k=normalize(ir16k))
+    os.replace(tmp, cacheFile)
+    print(ln)
+    return True
+
+
+def irName(ln):
+    dname = os.path.relpath(os.path.dirname(ln), irOriginal)
+    lout = [''.join(c for c in elem if c.isalnum()) for elem in dname.split(os.sep)]
+
+    basename = os.path.basename(ln)
+    basename = re.sub(r'.wav', '', basename, flags=re.IGNORECASE)
+    basename = ''.join(c for c in basename if c.isalnum())
+
+    # IRs are referred to by name in the lists and the banks, e.g.
+    # devices/aaronbrown/BehritoneirRecording, and categorised by their
+    # top directories (devices, spaces/small, spaces/medium, ...)
+    name = '/'.join(lout + [basename])
+    category = '/'.join(lout[:2]) if lout and lout[0] == 'spaces' else '/'.join(lout[:1])
+    return name, category
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", dest="jobs", type=int, default=os.cpu_count(), help="Number of IRs processed concurrently")
+    options = parser.parse_args()
+
+    os.makedirs(irCache, exist_ok=True)
+    swav = findWavs(irOriginal)
+
+    # processed IRs are cached by content hash: only new or modified files
+    # are resampled again
+    hashes = {ln: fileHash(ln) for ln in swav}
+    cacheFiles = {ln: os.path.join(irCache, f'{h}.npz') for ln, h in hashes.items()}
+    todo = [ln for ln in swav if not os.path.exists(cacheFiles[ln])]
+    print(f'{len(swav) - len(todo)} IRs up to date, {len(todo)} to process')
+
+    with ProcessPoolExecutor(max_workers=options.jobs) as executor:
+        list(executor.map(processIR, todo, [cacheFiles[ln] for ln in todo]))
+
+    manifest = []
+    nDevice = 0
+    nSpace = 0
+    bank8k = []
+    bank16k = []
+
+    with open(irDeviceList, 'w', encoding='utf-8') as fdevice, \
+         open(irSpaceList, 'w', encoding='utf-8') as fspace:
+        for ln in swav:
+            if not os.path.exists(cacheFiles[ln]):
+                continue
+
+            dname = os.path.dirname(ln)
+            name, category = irName(ln)
+            manifest.append((hashes[ln], ln, name, category))
+            foundSpace = any(kw in dname for kw in kwSpace) and not any(kw in dname for kw in kwBlockSpace)
+            foundDevice = any(kw in dname for kw in kwDevice)
+
+            if foundDevice or foundSpace:
+                with np.load(cacheFiles[ln]) as irs:
+                    bank8k.append((name, category, irs['ir8k']))
+                    bank16k.append((name, category, irs['ir16k']))
+
+            if foundDevice:
+                fdevice.write(f'{name}\n')
+                nDevice += 1
+
+            if foundSpace:
+                fspace.write(f'{name}\n')
+                nSpace += 1
+
+    writeBank(irBank, 8000, bank8k)
+    writeBank(irBank, 16000, bank16k)
+
+    # drop cache entries of IRs that are gone or have changed
+    live = {f'{hashes[ln]}.npz' for ln in swav}
+    for f in os.listdir(irCache):
+        if f.endswith('.npz') and f not in live:
+            os.remove(os.path.join(irCache, f))
+    # source hash -> outputs, the hash also names the cached IRs
+    with open(irManifest, 'w', encoding='utf-8') as f:
+        for h, ln, name, category in manifest:
+            f.write(f'{h}\t{ln}\t{name}\t{category}\n')
+
+    print(f'{nDevice} device IRs')
+    print(f'{nSpace} space IRs')
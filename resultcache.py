@@ -0,0 +1,165 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Content addressed cache of degraded files. The key of an output is the hash
+# of the input file content, the codec chain, the availability and version of
+# its codecs (a missing codec is passed through), the seed, the output rate,
+# the backend, the tool version and a fingerprint of the resources (file
+# lists, IR banks). Entries are stored as <cacheDir>/<key[:2]>/<key><ext>; hits are
+# served by reflink, hardlink or copy, in this order of preference. The cache
+# is kept under a size limit by evicting the least recently used entries (the
+# modification time of an entry is updated on every hit).
+
+import hashlib
+import os
+import shutil
+
+import codecbackend
+from sphere import splitChannel
+
+hashIndexHeader = '# input-hashes v1'
+
+# ioctl request to clone a file on Linux (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def fileHash(fileName):
+    h = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for data in iter(lambda: f.read(1 << 20), b''):
+            h.update(data)
+    return h.hexdigest()
+
+
+def fingerprintFiles(fileNames):
+    # hash of the content of the files that exist
+    h = hashlib.sha1()
+    for fileName in fileNames:
+        h.update(fileName.encode('utf-8') + b'\0')
+        if os.path.exists(fileName):
+            h.update(fileHash(fileName).encode('ascii'))
+    return h.hexdigest()
+
+
+def reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        # no ioctl (Windows): linkFile() falls back to a hardlink or a copy
+        raise OSError('reflink is not supported on this platform')
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+def linkFile(src, dst):
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    try:
+        reflink(src, tmp)
+    except OSError:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ResultCache:
+    def __init__(self, cacheDir, maxBytes, version=''):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.version = version
+        os.makedirs(cacheDir, exist_ok=True)
+        # input file hashes, validated by size and modification time
+        self.hashIndex = os.path.join(cacheDir, 'input-hashes.txt')
+        self.hashes = {}
+        self.dirty = False
+        if os.path.exists(self.hashIndex):
+            with open(self.hashIndex, encoding='utf-8') as f:
+                if f.readline().strip() == hashIndexHeader:
+                    for ln in f:
+                        s = ln.rstrip('\n').split('\t')
+                        if len(s) == 4:
+                            self.hashes[s[0]] = (int(s[1]), int(s[2]), s[3])
+
+    def inputHash(self, fileName):
+        # a channel of a SPHERE file ('xxxxA.sph') hashes as the file and the channel
+        path, channel = splitChannel(fileName)
+        st = os.stat(path)
+        entry = self.hashes.get(fileName)
+        if entry is None or entry[:2] != (st.st_size, st.st_mtime_ns):
+            entry = (st.st_size, st.st_mtime_ns, fileHash(path) + (f':{channel}' if path != fileName else ''))
+            self.hashes[fileName] = entry
+            self.dirty = True
+        return entry[2]
+
+    def key(self, fileIn, chain, seed, *extra):
+        h = hashlib.sha1()
+        for s in (self.version, self.inputHash(fileIn), chain, codecbackend.chainVersion(chain), seed) + extra:
+            h.update(str(s).encode('utf-8') + b'\0')
+        return h.hexdigest()
+
+    def entry(self, key, ext):
+        return os.path.join(self.cacheDir, key[:2], f'{key}{ext}')
+
+    def fetch(self, key, outputFile):
+        # serves outputFile from the cache, returns False on a miss
+        entry = self.entry(key, os.path.splitext(outputFile)[1])
+        if not os.path.exists(entry):
+            return False
+        os.utime(entry)
+        linkFile(entry, outputFile)
+        return True
+
+    def store(self, key, outputFile):
+        entry = self.entry(key, os.path.splitext(outputFile)[1])
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        linkFile(outputFile, entry)
+        os.utime(entry)
+
+    def evict(self):
+        entries = []
+        for d in os.scandir(self.cacheDir):
+            if d.is_dir():
+                for e in os.scandir(d.path):
+                    st = e.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, e.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = f'{self.hashIndex}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(f'{hashIndexHeader}\n')
+            for fileName, (size, mtime, h) in self.hashes.items():
+                f.write(f'{fileName}\t{size}\t{mtime}\t{h}\n')
+        os.replace(tmp, self.hashIndex)
+        self.dirty = False
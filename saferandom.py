@@ -0,0 +1,72 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Reproducible 'safe random' numbers. The integers of the text file 'random'
+# are converted once to a binary uint64 file ('random.u64') which is memory
+# mapped, so it is parsed once and shared by all processes through the page
+# cache. Draws give exactly the same values as parsing the text file:
+# int(float(nvalues) * float(rnd[rndidx]) / float(maxint)), all in float64.
+
+import os
+
+import numpy as np
+
+maxint = 9223372036854775807
+
+
+def loadTable(fileName='random'):
+    binFile = f'{fileName}.u64'
+    if not os.path.exists(binFile) or os.path.getmtime(binFile) < os.path.getmtime(fileName):
+        with open(fileName, 'r', encoding='utf-8') as f:
+            table = np.array([int(l) for l in f], dtype='<u8')
+        try:
+            tmp = f'{binFile}.{os.getpid()}.tmp'
+            table.tofile(tmp)
+            os.replace(tmp, binFile)
+        except OSError:
+            return table
+    return np.memmap(binFile, dtype='<u8', mode='r')
+
+
+class SafeRandom:
+    def __init__(self, table, seed=''):
+        self.rnd = table
+        self.rndidx = 0 if seed in ('', '0', 0, None) else int(seed) % len(table)
+
+    def draw(self, count):
+        idx = (self.rndidx + np.arange(count)) % len(self.rnd)
+        self.rndidx = (self.rndidx + count) % len(self.rnd)
+        return self.rnd[idx].astype(np.float64)
+
+    def getUniform(self, count=None):
+        if count is None:
+            return float(self.draw(1)[0]) / float(maxint)
+        return self.draw(count) / float(maxint)
+
+    def getRandom(self, nvalues, count=None):
+        if count is None:
+            out = int(float(nvalues) * float(self.rnd[self.rndidx]) / float(maxint))
+            self.rndidx = (self.rndidx + 1) % len(self.rnd)
+            return out
+        return (np.float64(nvalues) * self.draw(count) / float(maxint)).astype(np.int64)
+
+    def randomChoice(self, l):
+        return l[self.getRandom(len(l))]
@@ -0,0 +1,407 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Reader of NIST SPHERE files (the NIST SRE data): the header, and pcm, ulaw
+# and alaw samples, plain or compressed with shorten ('...,embedded-shorten-
+# v2.00'). One channel is read, block by block:
+#
+#   reader = SphereReader('xxxx.sph', channel=0)
+#   for x in reader.blocks(65536): ...    # float32 in [-1, 1)
+#
+# As in the file lists (README-file-lists.txt), 'xxxxA.sph' and 'xxxxB.sph'
+# stand for channel A and B of 'xxxx.sph'. Shorten streams are decoded by
+# sph2pipe when it is installed (it is faster than the decoder below) and
+# natively otherwise (native=True forces it): the reader then raises
+# NotImplementedError, as for shorten streams of sample types other than
+# linear 8/16 bit and ulaw, and the caller runs sph2pipe instead.
+
+import os
+import re
+import shutil
+from functools import lru_cache
+from operator import mul
+
+import numpy as np
+
+
+def splitChannel(fileName):
+    # (file, channel) of a file name, e.g. ('xxxx.sph', 1) for 'xxxxB.sph'
+    m = re.match(r'(.*)([AB])(\.sph)$', fileName)
+    if m and not os.path.exists(fileName) and os.path.exists(m.group(1) + m.group(3)):
+        return m.group(1) + m.group(3), 'AB'.index(m.group(2))
+    return fileName, 0
+
+
+@lru_cache(maxsize=None)
+def sph2pipeInstalled():
+    return shutil.which('sph2pipe') is not None
+
+
+def ulawTable():
+    # ITU-T G.711 u-law to 16-bit linear
+    u = ~np.arange(256) & 0xFF
+    t = (((u & 0x0F) << 3) + 0x84) << ((u & 0x70) >> 4)
+    return np.where(u & 0x80, 0x84 - t, t - 0x84)
+
+
+def alawTable():
+    a = np.arange(256) ^ 0x55
+    seg = (a & 0x70) >> 4
+    t = ((a & 0x0F) << 4) + np.where(seg == 0, 8, 0x108)
+    t = np.where(seg > 1, t << np.maximum(seg - 1, 0), t)
+    return np.where(a & 0x80, t, -t)
+
+
+def readHeader(f):
+    # fields of the header, with their types (-i int, -r real, -sN string)
+    if f.read(8) != b'NIST_1A\n':
+        raise ValueError('not a NIST SPHERE file')
+    headerSize = int(f.read(8))
+    f.seek(0)
+    fields = {}
+    for ln in f.read(headerSize).decode('ascii', 'replace').splitlines()[2:]:
+        if ln.startswith('end_head'):
+            break
+        s = ln.split(None, 2)
+        if len(s) < 3:
+            continue
+        name, typ, value = s
+        if typ == '-i':
+            fields[name] = int(value)
+        elif typ == '-r':
+            fields[name] = float(value)
+        elif typ.startswith('-s'):
+            fields[name] = value[:int(typ[2:])]
+    return fields, headerSize
+
+
+class BitReader:
+    # MSB-first bits of a file, one byte (0 or 1) per bit so that the unary
+    # codes of shorten are found with bytes.find, with a one appended as a
+    # sentinel. The blocks of signed codes of the residuals are only located
+    # by codes(); their values are computed with numpy, for many blocks at
+    # once, by values()
+    def __init__(self, f, chunkSize=1 << 16):
+        self.f = f
+        self.chunkSize = chunkSize
+        self.bits = b'\x01'
+        self.end = 0
+        self.pos = 0
+        # ends of the unary parts of the codes not computed yet, and their
+        # runs (position of the first code, number of codes, low bits)
+        self.ends = []
+        self.runs = []
+        self.done = []
+        self.queued = 0
+
+    def refill(self):
+        data = self.f.read(self.chunkSize)
+        if not data:
+            raise EOFError('truncated shorten stream')
+        # the positions of the pending codes change
+        self.compute()
+        self.bits = self.bits[self.pos:self.end] + np.unpackbits(np.frombuffer(data, dtype=np.uint8)).tobytes() + b'\x01'
+        self.end = len(self.bits) - 1
+        self.pos = 0
+
+    def uvar(self, k):
+        # unsigned: unary high part (zeros ended by a one), k low bits
+        q = self.bits.find(1, self.pos)
+        while q + k >= self.end:
+            self.refill()
+            q = self.bits.find(1, self.pos)
+        v = q - self.pos
+        for b in self.bits[q + 1:q + 1 + k]:
+            v = v << 1 | b
+        self.pos = q + 1 + k
+        return v
+
+    def svar(self, k):
+        v = self.uvar(k + 1)
+        return ~(v >> 1) if v & 1 else v >> 1
+
+    def ulong(self):
+        return self.uvar(self.uvar(2))
+
+    def codes(self, n, k):
+        # skips n signed codes with k low bits (the inner loop of the
+        # decoder); their values will be values()[i:i + n], i returned
+        step = k + 2
+        while True:
+            find = self.bits.find
+            ends = [0] * n
+            p = self.pos
+            for i in range(n):
+                ends[i] = p = find(1, p)
+                p += step
+            # -1 (searching past the sentinel) or the sentinel: more bits needed
+            if not n or (min(ends) >= 0 and p <= self.end):
+                break
+            self.refill()
+        if n:
+            self.ends += ends
+            self.runs.append((self.pos, n, k + 1))
+        self.pos = p
+        i = self.queued
+        self.queued += n
+        return i
+
+    def compute(self):
+        if not self.runs:
+            return
+        q = np.array(self.ends, dtype=np.int64)
+        starts, counts, lows = (np.array(a, dtype=np.int64) for a in zip(*self.runs))
+        k = np.repeat(lows, counts)
+        first = np.cumsum(counts) - counts
+        start = np.empty_like(q)
+        start[1:] = q[:-1] + k[:-1] + 1
+        start[first] = starts
+        # the k bits after the unary part, from the 40 bits (k <= 32) of the
+        # 5 bytes holding the first one
+        packed = np.concatenate([np.packbits(np.frombuffer(self.bits, dtype=np.uint8)), np.zeros(5, dtype=np.uint8)])
+        b = (q + 1) >> 3
+        word = packed[b].astype(np.int64)
+        for j in range(1, 5):
+            word = word << 8 | packed[b + j]
+        low = (word >> (40 - ((q + 1) & 7) - k)) & ((1 << k) - 1)
+        v = (q - start) << k | low
+        self.done.append(np.where(v & 1, ~(v >> 1), v >> 1))
+        self.ends, self.runs = [], []
+
+    def values(self):
+        # values of the codes queued since the last call
+        self.compute()
+        v = np.concatenate(self.done) if self.done else np.zeros(0, dtype=np.int64)
+        self.done, self.queued = [], 0
+        return v
+
+
+def cdiv(a, b):
+    # C integer division (truncated towards zero)
+    q = abs(a) // b
+    return -q if a < 0 else q
+
+
+# shorten function codes and file types
+fnDiff0, fnDiff1, fnDiff2, fnDiff3, fnQuit, fnBlockSize, fnBitShift, fnQLPC, fnZero, fnVerbatim = range(10)
+typeS8, typeU8, typeS16HL, typeU16HL, typeS16LH, typeU16LH, typeULaw = 1, 2, 3, 4, 5, 6, 7
+
+
+class ShortenDecoder:
+    # shorten versions 1 and 2 (as sph2pipe); blocks() yields (channel,
+    # samples) in stream order
+    def __init__(self, f):
+        if f.read(4) != b'ajkg':
+            raise ValueError('not a shorten stream')
+        self.version = f.read(1)[0]
+        if self.version not in (1, 2):
+            raise NotImplementedError(f'shorten version {self.version}')
+        self.br = BitReader(f)
+        self.fileType = self.br.ulong()
+        self.channels = self.br.ulong()
+        self.blockSize = self.br.ulong()
+        self.maxnlpc = self.br.ulong()
+        self.nmean = self.br.ulong()
+        for _ in range(self.br.ulong()):
+            self.br.uvar(7)
+        if self.fileType not in (typeS8, typeU8, typeS16HL, typeU16HL, typeS16LH, typeU16LH, typeULaw):
+            raise NotImplementedError(f'shorten file type {self.fileType}')
+
+    def parse(self, maxBlocks):
+        # commands up to the end or maxBlocks blocks of samples: (cmd,
+        # blockSize, bitShift, QLPC coefficients, index of the residuals)
+        br = self.br
+        parsed = []
+        while len(parsed) < maxBlocks:
+            cmd = br.uvar(2)
+            if cmd == fnQuit:
+                self.quit = True
+                break
+            if cmd == fnBlockSize:
+                self.curBlockSize = br.ulong()
+            elif cmd == fnBitShift:
+                self.bitShift = br.uvar(2)
+            elif cmd == fnVerbatim:
+                for _ in range(br.uvar(5)):
+                    br.uvar(8)
+            elif cmd == fnZero:
+                parsed.append((cmd, self.curBlockSize, self.bitShift, None, 0))
+            elif cmd == fnQLPC:
+                k = br.uvar(3)
+                order = br.uvar(2)
+                coefs = [br.svar(5) for _ in range(order)][::-1]
+                parsed.append((cmd, self.curBlockSize, self.bitShift, coefs, br.codes(self.curBlockSize, k)))
+            elif cmd <= fnDiff3:
+                k = br.uvar(3)
+                parsed.append((cmd, self.curBlockSize, self.bitShift, None, br.codes(self.curBlockSize, k)))
+            else:
+                raise ValueError(f'bad shorten function code {cmd}')
+        return parsed
+
+    def blocks(self, batchBlocks=512):
+        # the residuals of batchBlocks blocks are computed at once, then the
+        # samples are predicted block by block
+        version, nmean = self.version, self.nmean
+        nwrap = max(3, self.maxnlpc)
+        lpcqOffset = 32 if version > 1 else 0
+        history = [[0] * nwrap for _ in range(self.channels)]
+        offsets = [[0] * max(nmean, 1) for _ in range(self.channels)]
+        self.curBlockSize, self.bitShift, self.quit = self.blockSize, 0, False
+        chan = 0
+        while not self.quit:
+            parsed = self.parse(batchBlocks)
+            res = self.br.values()
+            for cmd, blockSize, bitShift, coefs, i in parsed:
+                # offset: mean of the last nmean blocks of the channel
+                if nmean == 0:
+                    coffset = offsets[chan][0]
+                else:
+                    coffset = cdiv((nmean // 2 if version >= 2 else 0) + sum(offsets[chan]), nmean)
+                    if version >= 2:
+                        coffset >>= bitShift
+                h = history[chan]
+                if cmd == fnZero:
+                    x = np.zeros(blockSize, dtype=np.int64)
+                elif cmd == fnQLPC:
+                    # the prediction is rounded down at every sample, so the
+                    # recursion is not a linear filter (lfilter would not be
+                    # exact): one sample at a time
+                    order = len(coefs)
+                    r = res[i:i + blockSize].tolist()
+                    buf = [v - coffset for v in h[nwrap - order:]] + [0] * blockSize
+                    for j in range(blockSize):
+                        buf[order + j] = r[j] + ((lpcqOffset + sum(map(mul, coefs, buf[j:j + order]))) >> 5)
+                    x = np.array(buf[order:], dtype=np.int64) + coffset
+                elif cmd == fnDiff0:
+                    x = res[i:i + blockSize] + coffset
+                else:
+                    # fixed predictors of order 1-3: integrate the residual
+                    x = res[i:i + blockSize]
+                    diffs = [h[-1], h[-1] - h[-2], h[-1] - 2 * h[-2] + h[-3]]
+                    for m in range(cmd - 1, -1, -1):
+                        x = diffs[m] + np.cumsum(x)
+
+                if nmean > 0:
+                    mean = cdiv((blockSize // 2 if version >= 2 else 0) + int(x.sum()), blockSize)
+                    offsets[chan] = offsets[chan][1:] + [mean << bitShift if version >= 2 else mean]
+                history[chan] = (h + x[-nwrap:].tolist())[-nwrap:]
+                yield chan, x << bitShift if bitShift else x
+                chan = (chan + 1) % self.channels
+
+
+class SphereReader:
+    def __init__(self, fileName, channel=None, native=None):
+        fileName, ch = splitChannel(fileName)
+        self.fileName = fileName
+        self.channel = ch if channel is None else channel
+        with open(fileName, 'rb') as f:
+            fields, self.headerSize = readHeader(f)
+        self.rate = int(fields.get('sample_rate', 8000))
+        self.channels = int(fields.get('channel_count', 1))
+        self.nSamples = int(fields.get('sample_count', 0))
+        self.sampleBytes = int(fields.get('sample_n_bytes', 2))
+        coding = str(fields.get('sample_coding', 'pcm')).lower()
+        self.shorten = 'shorten' in coding
+        self.coding = 'ulaw' if 'ulaw' in coding or 'mu-law' in coding else 'alaw' if 'alaw' in coding else 'pcm'
+        self.bigEndian = fields.get('sample_byte_format', '01') == '10'
+        if self.channel >= self.channels:
+            raise ValueError(f'{fileName} has no channel {"AB"[self.channel] if self.channel < 2 else self.channel}')
+        if self.shorten:
+            if native is None:
+                native = not sph2pipeInstalled()
+            if not native:
+                raise NotImplementedError('shorten streams are decoded by sph2pipe')
+            with open(fileName, 'rb') as f:
+                f.seek(self.headerSize)
+                ShortenDecoder(f)
+
+    def convert(self, s):
+        # samples of the file (ints, or bytes for ulaw/alaw) to float32
+        if self.coding == 'ulaw':
+            s = ulawTable()[s]
+        elif self.coding == 'alaw':
+            s = alawTable()[s]
+        elif self.sampleBytes == 1:
+            return s.astype(np.float32) / 128
+        return s.astype(np.float32) / 32768
+
+    def blocks(self, blockSize=65536):
+        if self.shorten:
+            yield from self.shortenBlocks(blockSize)
+            return
+        dtype = np.dtype(np.uint8 if self.coding != 'pcm' else np.int8 if self.sampleBytes == 1 else
+                         '>i2' if self.bigEndian else '<i2')
+        frame = dtype.itemsize * self.channels
+        with open(self.fileName, 'rb') as f:
+            f.seek(self.headerSize)
+            n = self.nSamples or (os.fstat(f.fileno()).st_size - self.headerSize) // frame
+            while n > 0:
+                data = f.read(min(n, blockSize) * frame)
+                if len(data) < frame:
+                    break
+                s = np.frombuffer(data[:len(data) // frame * frame], dtype=dtype).reshape(-1, self.channels)
+                n -= len(s)
+                yield self.convert(s[:, self.channel])
+
+    def shortenBlocks(self, blockSize):
+        with open(self.fileName, 'rb') as f:
+            f.seek(self.headerSize)
+            dec = ShortenDecoder(f)
+            if dec.fileType == typeULaw:
+                # shorten codes ulaw as 13-bit linear values
+                table = ulawTable()
+                keys, idx = np.unique(table >> 3, return_index=True)
+                toUlaw = lambda x: idx[np.clip(np.searchsorted(keys, x), 0, len(keys) - 1)]
+                self.coding = 'ulaw'
+            n = self.nSamples or None
+            pending, nPending = [], 0
+            for chan, x in dec.blocks():
+                if chan != self.channel:
+                    continue
+                if dec.fileType == typeULaw:
+                    x = toUlaw(x)
+                elif dec.fileType in (typeU8, typeU16HL, typeU16LH):
+                    x = x - (128 if dec.fileType == typeU8 else 32768)
+                if dec.fileType in (typeS8, typeU8):
+                    self.sampleBytes = 1
+                pending.append(x)
+                nPending += len(x)
+                if nPending >= blockSize:
+                    y = np.concatenate(pending)
+                    if n is not None:
+                        y, n = y[:n], n - min(n, len(y))
+                    yield self.convert(y)
+                    pending, nPending = [], 0
+                    if n == 0:
+                        return
+            if pending:
+                y = np.concatenate(pending)
+                yield self.convert(y[:n] if n is not None else y)
+
+    def read(self):
+        blocks = list(self.blocks())
+        return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def readSphere(fileName, channel=None, native=None):
+    # (samples, rate) of one channel
+    reader = SphereReader(fileName, channel, native)
+    return reader.read(), reader.rate
@@ -21,61 +21,25 @@ import sys
 import random
 import os
 
+from saferandom import SafeRandom, loadTable
 
-def initRandom(file, seed):
-    global rnd
-    global rndidx
-
-    rndidx = 0
-    rnd = []
-    with open(file, 'r', encoding='utf-8') as f:
-        for l in f.readlines():
-            rnd.append(l.strip())
 
-    if seed == '' or seed == '0':
-        rndidx = 0
-    else:
-        rndidx = int(seed)
-    if rndidx >= len(rnd):
-        rndidx = rndidx % len(rnd)
+def initRandom(file, seed):
+    global rs
 
-    return rnd
+    rs = SafeRandom(loadTable(file), seed)
+    return rs
 
 
 def getRandom():
-    global rndidx
-    global rnd
-
-    maxint = 9223372036854775807
-
-    out = float(rnd[rndidx]) / float(maxint)
-
-    rndidx = rndidx + 1
-    if rndidx == len(rnd):
-        rndidx = 0
-
-    return out
+    return rs.getUniform()
 
 
 def getRandomInt(nvalues):
-    global rndidx
-    global rnd
-
-    maxint = 9223372036854775807
-
-    out = int(float(nvalues - 1) * float(rnd[rndidx]) / float(maxint))
-
-    rndidx = rndidx + 1
-    if rndidx == len(rnd):
-        rndidx = 0
-
-    return out
+    return rs.getRandom(nvalues - 1)
 
 
 def listShuffle(l):
-    global rnd
-    global rndidx
-
     idx = list(range(0, len(l)))
     idxp = list(idx)
     for i in idx:
@@ -0,0 +1,146 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Cache of the intermediate buffers of the numpy backend. The buffer after the
+# first k steps of a chain is keyed by the input file (path, size, mtime), the
+# rate and the k steps (with the version of their codecs, see
+# codecbackend.version); the position in the random table at the start of the
+# chain is part of the key only once a step that draws random numbers is in
+# the prefix, so e.g. the decoded and normalized input is shared by all the
+# conditions with the same 'norm' level. Along with a buffer the cache keeps
+# the number of random draws done by its prefix, so a chain resumed from the
+# cache continues with the same random numbers. The numpy backend only stores
+# the prefixes before the first random step (sharedSteps): the later ones are
+# keyed on the seed of the degradation and hardly ever reused, and the whole
+# chain is kept by the result cache.
+#
+# Buffers are kept in memory up to memBytes (least recently used first out)
+# and, if cacheDir is given, also on disk up to diskBytes.
+
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+import codecbackend
+from sphere import splitChannel
+
+# steps which draw from the random table
+randomSteps = ('noise', 'irdevice', 'irspace')
+
+
+class StageCache:
+    def __init__(self, memBytes=512 * 2**20, cacheDir=None, diskBytes=10 * 2**30):
+        self.memBytes = memBytes
+        self.mem = OrderedDict()
+        self.memUsed = 0
+        self.cacheDir = cacheDir
+        self.diskBytes = diskBytes
+        self.diskUsed = None
+        if cacheDir:
+            os.makedirs(cacheDir, exist_ok=True)
+
+    def prefixKeys(self, fileIn, rate, steps, rndidx, context=''):
+        # keys of the buffers after 0, 1, ..., len(steps) steps
+        st = os.stat(splitChannel(fileIn)[0])
+        h = hashlib.sha1(f'{context}\0{os.path.abspath(fileIn)}\0{st.st_size}\0{st.st_mtime_ns}\0{rate}'.encode('utf-8'))
+        keys = [h.hexdigest()]
+        seeded = False
+        for codec, opts in steps:
+            if codec in randomSteps and not seeded:
+                h.update(f'\0seed={rndidx}'.encode('utf-8'))
+                seeded = True
+            h.update(f'\0{codec}[{opts}]'.encode('utf-8'))
+            if codec in codecbackend.codecRates:
+                # a missing codec is passed through
+                h.update(f'\0{codecbackend.version(codec)}'.encode('utf-8'))
+            keys.append(h.hexdigest())
+        return keys
+
+    @staticmethod
+    def sharedSteps(steps):
+        # number of steps before the first one drawing random numbers
+        for k, (codec, _) in enumerate(steps):
+            if codec in randomSteps:
+                return k
+        return len(steps)
+
+    def diskFile(self, key):
+        return os.path.join(self.cacheDir, f'{key}.npz')
+
+    def get(self, key):
+        # returns (buffer, number of random draws) or None
+        if key in self.mem:
+            self.mem.move_to_end(key)
+            return self.mem[key]
+        if not self.cacheDir or not os.path.exists(self.diskFile(key)):
+            return None
+        try:
+            with np.load(self.diskFile(key)) as f:
+                x, draws = f['x'], int(f['draws'])
+            os.utime(self.diskFile(key))
+        except (OSError, ValueError, KeyError):
+            return None
+        self.putMem(key, x, draws)
+        return self.mem[key]
+
+    def put(self, key, x, draws):
+        if key in self.mem:
+            return
+        self.putMem(key, x, draws)
+        if self.cacheDir:
+            fileName = self.diskFile(key)
+            tmp = f'{fileName}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez(f, x=x, draws=draws)
+            os.replace(tmp, fileName)
+            if self.diskUsed is None:
+                self.evictDisk()
+            else:
+                self.diskUsed += os.path.getsize(fileName)
+                if self.diskUsed > self.diskBytes:
+                    self.evictDisk()
+
+    def putMem(self, key, x, draws):
+        # cached buffers are shared, so they must not be modified in place
+        x.flags.writeable = False
+        self.mem[key] = (x, draws)
+        self.memUsed += x.nbytes
+        while self.memUsed > self.memBytes and len(self.mem) > 1:
+            _, (y, _) = self.mem.popitem(last=False)
+            self.memUsed -= y.nbytes
+
+    def evictDisk(self):
+        entries = []
+        for e in os.scandir(self.cacheDir):
+            if e.name.endswith('.npz'):
+                st = e.stat()
+                entries.append((st.st_mtime_ns, st.st_size, e.path))
+        self.diskUsed = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self.diskUsed <= self.diskBytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.diskUsed -= size
@@ -0,0 +1,144 @@
+# The MIT License (MIT)
+# Copyright (c) 2015 Microsoft Corporation
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Per-step instrumentation of the degradation chain. Every step records its
+# wall time, CPU time (including the subprocesses it waited for), the bytes
+# read and written by the process (/proc/self/io, Linux only) and the number
+# of subprocesses started. A disabled log (StepLog(enabled=False)) measures
+# nothing; the audit hook counting the subprocesses is installed by the first
+# step of an enabled log and ignores the events outside of such steps.
+# Records are written as JSON lines, one per step; summarize() aggregates
+# them, e.g. per condition or per codec:
+#
+#   python steplog.py log.jsonl
+
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+nSubprocesses = 0
+# number of enabled steps running, and whether the audit hook is installed
+# (audit hooks cannot be removed)
+nActiveSteps = 0
+hookInstalled = False
+
+
+def auditHook(event, args):
+    global nSubprocesses
+    if nActiveSteps and event == 'subprocess.Popen':
+        nSubprocesses += 1
+
+
+def installHook():
+    global hookInstalled
+    if not hookInstalled:
+        sys.addaudithook(auditHook)
+        hookInstalled = True
+
+
+def ioCounters():
+    try:
+        with open('/proc/self/io') as f:
+            io = dict(ln.split(':') for ln in f)
+        return int(io['rchar']), int(io['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def cpuTime():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class StepLog:
+    def __init__(self, enabled=True, **context):
+        # context (input file, chain, backend, ...) is added to every record
+        self.enabled = enabled
+        self.context = context
+        self.records = []
+
+    @contextmanager
+    def step(self, name, opts=''):
+        # the step may add its own fields (e.g. the achieved SNR) to the
+        # dictionary it receives
+        global nActiveSteps
+        info = {}
+        if not self.enabled:
+            yield info
+            return
+        installHook()
+        nActiveSteps += 1
+        wall, cpu, io, nProc = time.perf_counter(), cpuTime(), ioCounters(), nSubprocesses
+        try:
+            yield info
+        finally:
+            nActiveSteps -= 1
+            read, written = ioCounters()
+            self.records.append(dict(self.context, step=name, opts=opts, index=len(self.records),
+                                     wall=time.perf_counter() - wall, cpu=cpuTime() - cpu,
+                                     bytesRead=read - io[0], bytesWritten=written - io[1],
+                                     subprocesses=nSubprocesses - nProc, **info))
+
+    def write(self, fileName):
+        # one write per line in append mode, so concurrent jobs can share a log
+        with open(fileName, 'a', encoding='utf-8') as f:
+            for r in self.records:
+                f.write(json.dumps(r) + '\n')
+                f.flush()
+
+
+def readLog(fileName):
+    with open(fileName, encoding='utf-8') as f:
+        return [json.loads(ln) for ln in f if ln.strip()]
+
+
+def summarize(records, key):
+    # totals of the numeric fields per value of the field 'key'
+    totals = defaultdict(lambda: dict(count=0, wall=0.0, cpu=0.0, bytesRead=0, bytesWritten=0, subprocesses=0))
+    for r in records:
+        t = totals[r.get(key, '')]
+        t['count'] += 1
+        for k in ('wall', 'cpu', 'bytesRead', 'bytesWritten', 'subprocesses'):
+            t[k] += r.get(k, 0)
+    return dict(totals)
+
+
+def printSummary(records, key):
+    totals = summarize(records, key)
+    wallTotal = sum(t['wall'] for t in totals.values()) or 1
+    print(f'{key:<24} {"count":>7} {"wall s":>9} {"%":>6} {"cpu s":>9} {"MB read":>9} {"MB written":>10} {"procs":>7}')
+    for name, t in sorted(totals.items(), key=lambda kv: -kv[1]['wall']):
+        print(f'{str(name):<24} {t["count"]:>7} {t["wall"]:>9.2f} {100 * t["wall"] / wallTotal:>6.1f} {t["cpu"]:>9.2f} '
+              f'{t["bytesRead"] / 2**20:>9.1f} {t["bytesWritten"] / 2**20:>10.1f} {t["subprocesses"]:>7}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Syntax: steplog.py log.jsonl [field ...]')
+        sys.exit(0)
+
+    records = readLog(sys.argv[1])
+    for key in sys.argv[2:] or ['condition', 'step']:
+        printSummary(records, key)
+        print()